@@ -2,10 +2,17 @@
 import sys
 import os
 import json
-import pandas as pd
 import numpy as np
 from collections import OrderedDict
 
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), '..', '..', 'data_prep'))
+
+from load_data import read_csv
+from shared_table import read_shared_table, shared_table_current
+from compact_dtypes import compact_frame, report_summary
+from profiling import step, record_frame, record_info
+
 dry_run = False
 if len(sys.argv) == 2:
     if sys.argv[1] in [1, "1", "True", "true", "T", "t", "yes", "Y", "Yes"]:
@@ -20,42 +27,54 @@ else:
     repo_dir = os.path.realpath(".")
 
 
-def read_csv(path):
-    '''read csv using pandas
-    '''
-    return pd.read_csv(path, quotechar='\"',
-                       na_values='', keep_default_na=False,
-                       encoding='utf-8')
+# hold categorical / id / covariate fields in compact dtypes
+# (see compact_dtypes.py)
+compact_load = True
+
+# only fields/rows used by the project stats are read from base data
+stats_columns = ['gef_id', 'type', 'iba_area']
+stats_filters = [('type', '!=', 'rand')]
 
 
-# load main data
+# load main data (from memory mapped base table when available and not
+# older than base_data.csv, see shared_table.py)
 data_csv = "{0}/data_prep/analysis_cases/base_data.csv".format(repo_dir)
-data_df = read_csv(data_csv)
-data_df = data_df.loc[data_df['type'] != 'rand']
+data_table = "{0}/data_prep/analysis_cases/base_data.arrow".format(repo_dir)
+with step('load base data') as s:
+    if shared_table_current(data_table, data_csv):
+        data_df = read_shared_table(data_table, columns=stats_columns,
+                                    filters=stats_filters)
+    else:
+        data_df = read_csv(data_csv, columns=stats_columns,
+                           filters=stats_filters)
+    if compact_load:
+        data_df, compact_report_df = compact_frame(data_df)
+        record_info(s, bytes_saved=int(compact_report_df['bytes_saved'].sum()))
+        print '\n'.join(report_summary(compact_report_df))
+    record_frame(s, data_df)
 
 
 
 def build_case(case_id, dry_run=dry_run):
     print "Running {0}".format(str(case_id).upper())
-    case_df = data_df.copy(deep=True)
-
-    case_id_list = [case_id]
-    if case_id == 'bio':
-        case_id_list.append('ext_bio')
-
-    case_df = case_df.loc[data_df['type'].isin(case_id_list)]
-
-    case_df = case_df[['gef_id', 'iba_area']]
+    with step('build_case {0}'.format(case_id)) as s:
+        case_id_list = [case_id]
+        if case_id == 'bio':
+            case_id_list.append('ext_bio')
 
-    case_result_df = case_df.groupby("gef_id")['iba_area'].agg({"location_count": 'size'}).join(case_df.groupby('gef_id')['iba_area'].sum())
+        # only the case rows of the two stats fields are taken from data_df
+        case_df = data_df.loc[data_df['type'].isin(case_id_list),
+                              ['gef_id', 'iba_area']]
 
-    case_result_df['gef_id'] = case_result_df.index
-    case_result_df = case_result_df[['gef_id', 'location_count', 'iba_area']]
+        case_result_df = case_df.groupby("gef_id")['iba_area'].agg({"location_count": 'size'}).join(case_df.groupby('gef_id')['iba_area'].sum())
 
-    case_out = "{0}/results/{1}_project_stats.csv".format(repo_dir, case_id)
-    if not dry_run:
-        case_result_df.to_csv(case_out, index=False, encoding='utf-8')
+        case_result_df['gef_id'] = case_result_df.index
+        case_result_df = case_result_df[['gef_id', 'location_count', 'iba_area']]
+        record_frame(s, case_result_df)
 
+        case_out = "{0}/results/{1}_project_stats.csv".format(repo_dir, case_id)
+        if not dry_run:
+            case_result_df.to_csv(case_out, index=False, encoding='utf-8')
 
     stats = OrderedDict()
 
@@ -1,9 +1,25 @@
 
 import sys
 import os
-import pandas as pd
 import numpy as np
 
+from load_data import read_csv
+from components import component_tags, tag_ids
+from gef_id_registry import (parse_ids, id_set, union, in_set, invalid_key,
+                             parse_failures)
+from start_year import impute_start_year
+from ndvi import ndvi_period_stats
+from case_definitions import case_definitions
+from case_builder import (build_bitmap_index, case_treatment, case_counts,
+                          case_columns, case_export_path, row_hashes,
+                          case_fingerprint, case_is_current, read_manifest,
+                          write_manifest, write_cases)
+from case_query import save_case_index
+from compact_dtypes import compact_frame, report_summary
+from shared_table import write_shared_table
+from lazy_geometry import drop_geometry, with_geometry
+from profiling import step, record_frame, record_info
+
 dry_run = False
 if len(sys.argv) == 2:
     if sys.argv[1] in [1, "1", "True", "true", "T", "t", "yes", "Y", "Yes"]:
@@ -18,17 +34,37 @@ else:
     repo_dir = os.path.realpath(".")
 
 
-def read_csv(path):
-    '''read csv using pandas
-    '''
-    return pd.read_csv(path, quotechar='\"',
-                       na_values='', keep_default_na=False,
-                       encoding='utf-8')
+# seed for random start years assigned to controls
+start_year_seed = 2013
+
+# seed for random multicountry / multiagency flags assigned to controls
+control_flag_seed = 2016
+
+# hold categorical / id / covariate fields in compact dtypes
+# (see compact_dtypes.py). off by default, covariates converted to
+# float32 would be written rounded to base data and every case
+compact_load = False
+
+# case output format
+#   'csv'                 every base data field (read by analysis/round_02)
+#   'parquet' / 'feather' case partitioned columnar exports with only the
+#                         id, covariate and outcome fields of each case
+#                         (see case_definitions.py)
+case_export = 'csv'
 
 
 # load main data
 data_csv = "{0}/data_prep/merged_data.csv".format(repo_dir)
-data_raw_df = read_csv(data_csv)
+with step('load merged data') as s:
+    # full read (served from the feather cache of merged_data.csv). wkt
+    # geometry text is dropped, it is rebuilt from longitude / latitude
+    # for the rows written to base data and cases (see lazy_geometry.py)
+    data_raw_df, geometry_loc = drop_geometry(read_csv(data_csv))
+    if compact_load:
+        data_raw_df, compact_report_df = compact_frame(data_raw_df)
+        record_info(s, bytes_saved=int(compact_report_df['bytes_saved'].sum()))
+        print '\n'.join(report_summary(compact_report_df))
+    record_frame(s, data_raw_df)
 
 # initialize treatment field as -1
 # for each case:
@@ -39,16 +75,14 @@ data_raw_df['treatment'] = -1
 
 # add gef_id of -1 to random control points
 # so we can match on field without nan errors
-data_raw_df.loc[data_raw_df['type'] == 'rand', 'gef_id'] = -1
-
-def clean_gef_id(val):
-    try:
-        return str(int(val))
-    except:
-        return -999
-
-data_raw_df['gef_id'] = data_raw_df['gef_id'].apply(lambda z: clean_gef_id(z))
-data_raw_df = data_raw_df.loc[data_raw_df['gef_id'] != -999]
+# (gef ids are held as int64 keys, see gef_id_registry.py)
+with step('clean gef ids') as s:
+    gef_keys = parse_ids(data_raw_df['gef_id'], source='merged_data gef_id')
+    gef_keys[(data_raw_df['type'] == 'rand').values] = -1
+    data_raw_df['gef_id'] = gef_keys
+    data_raw_df = data_raw_df.loc[gef_keys != invalid_key]
+    record_frame(s, data_raw_df)
+    record_info(s, parse_failures=len(parse_failures))
 
 
 # -----------------------------------------------------------------------------
@@ -66,76 +100,27 @@ ancillary_06_csv = "{0}/raw_data/ancillary/nocd_lists.csv".format(repo_dir)
 ancillary_01_df = read_csv(ancillary_01_csv)
 ancillary_02_df = read_csv(ancillary_02_csv)
 ancillary_03_df = read_csv(ancillary_03_csv)
-ancillary_04_df = read_csv(ancillary_04_csv)
-ancillary_05_df = read_csv(ancillary_05_csv)
+ancillary_04_df = read_csv(ancillary_04_csv,
+                           columns=['GEF_ID', 'Country', 'Secondary agency(ies)'])
+ancillary_05_df = read_csv(ancillary_05_csv, columns=['Project GEF_ID'])
 ancillary_06_df = read_csv(ancillary_06_csv)
 
 
 # -------------------------------------
-# build land component list
-
-# check GEF project records (if any column contains "LD")
-cnames_01 = [i for i in list(ancillary_01_df.columns) if i != 'GEF ID']
-matches_01 = ['LD' in list(ancillary_01_df.iloc[i])
-              for i in range(len(ancillary_01_df))]
-land_id_list_01 = list(ancillary_01_df.loc[matches_01, 'GEF ID'].astype('str'))
-
-
-cnames_02 = [i for i in list(ancillary_02_df.columns) if i != 'GEF ID']
-matches_02 = ['LD' in list(ancillary_02_df.iloc[i])
-              for i in range(len(ancillary_02_df))]
-land_id_list_02 = list(ancillary_02_df.loc[matches_02, 'GEF ID'].astype('str'))
-
-
-# check aiddata ancillary ("Sub-Foci" column)
-land_keywords = ["LD", "Sustainable", "SFM", "REDD", "LULUCF",
-                 "Land", "Degradation", "Degredation", "Sustainable"]
-
-raw_land_matches = ancillary_03_df['Sub-Foci'].str.contains('|'.join(land_keywords))
-clean_land_matches = [
-    False if np.isnan(x) else x
-    for x in raw_land_matches
-]
-land_id_list_03 = list(ancillary_03_df.loc[clean_land_matches, 'GEF_ID']
-    .astype('int').astype('str'))
-
-
-# combine different land id lists
-land_component_id_list = land_id_list_01 + land_id_list_02 + land_id_list_03
-land_component_id_list = list(set(land_component_id_list))
-
-
-# -------------------------------------
-# build bio component list
-
-# check GEF project records (if any column contains "BD")
-cnames_03 = [i for i in list(ancillary_01_df.columns) if i != 'GEF ID']
-matches_03 = ['BD' in list(ancillary_01_df.iloc[i])
-              for i in range(len(ancillary_01_df))]
-bio_id_list_01 = list(ancillary_01_df.loc[matches_01, 'GEF ID'].astype('str'))
-
-
-cnames_04 = [i for i in list(ancillary_02_df.columns) if i != 'GEF ID']
-matches_04 = ['BD' in list(ancillary_02_df.iloc[i])
-              for i in range(len(ancillary_02_df))]
-bio_id_list_02 = list(ancillary_02_df.loc[matches_02, 'GEF ID'].astype('str'))
-
-
-# check aiddata ancillary ("Sub-Foci" column)
-bio_keywords = ["BD", "Biodiversity"]
-
-raw_bio_matches = ancillary_03_df['Sub-Foci'].str.contains('|'.join(bio_keywords))
-clean_bio_matches = [
-    False if np.isnan(x) else x
-    for x in raw_bio_matches
-]
-bio_id_list_03 = list(ancillary_03_df.loc[clean_bio_matches, 'GEF_ID']
-    .astype('int').astype('str'))
+# build land and bio component lists
 
+# focal area tags of each gef id from GEF project records (any column
+# containing the tag, e.g. "LD" or "BD") and the aiddata ancillary
+# ("Sub-Foci" column keywords, see components.py)
+with step('component tags') as s:
+    component_tags_df = component_tags(
+        cell_sheets=[(ancillary_01_df, 'GEF ID'),
+                     (ancillary_02_df, 'GEF ID')],
+        keyword_sheets=[(ancillary_03_df, 'GEF_ID', 'Sub-Foci')])
+    record_frame(s, component_tags_df)
 
-# combine different bio id lists
-bio_component_id_list = bio_id_list_01 + bio_id_list_02 + bio_id_list_03
-bio_component_id_list = list(set(bio_component_id_list))
+land_component_id_list = tag_ids(component_tags_df, 'LD')
+bio_component_id_list = tag_ids(component_tags_df, 'BD')
 
 
 # -------------------------------------
@@ -146,17 +131,18 @@ bio_component_id_list = list(set(bio_component_id_list))
 
 
 # no cd lists
-land_nocd_id_list = list(set(ancillary_06_df['ld'][ancillary_06_df['ld'].notnull()].astype('int').astype('str')))
-bio_nocd_id_list = list(set(ancillary_06_df['bio'][ancillary_06_df['bio'].notnull()].astype('int').astype('str')))
-mfa_nocd_id_list = list(set(ancillary_06_df['mfa'][ancillary_06_df['mfa'].notnull()].astype('int').astype('str')))
+# id lists are sorted unique int64 key arrays (see gef_id_registry.py)
+land_nocd_id_list = id_set(ancillary_06_df['ld'], source='nocd ld')
+bio_nocd_id_list = id_set(ancillary_06_df['bio'], source='nocd bio')
+mfa_nocd_id_list = id_set(ancillary_06_df['mfa'], source='nocd mfa')
 
 
-mfa_master_id_list = list(set(data_raw_df.loc[data_raw_df['Focal Area'] == 'Multi Focal Area', 'gef_id'].astype('int').astype('str')))
-# non_mfa_id_list = list(set(data_raw_df.loc[data_raw_df['Focal Area'] != 'Multi Focal Area', 'gef_id'].astype('int').astype('str')))
+mfa_master_id_list = id_set(data_raw_df.loc[data_raw_df['Focal Area'] == 'Multi Focal Area', 'gef_id'])
+# non_mfa_id_list = id_set(data_raw_df.loc[data_raw_df['Focal Area'] != 'Multi Focal Area', 'gef_id'])
 
-mfa_financials_id_list = list(set(data_raw_df.loc[data_raw_df['GEF ID'].notnull(), 'gef_id'].astype('int').astype('str')))
+mfa_financials_id_list = id_set(data_raw_df.loc[data_raw_df['GEF ID'].notnull(), 'gef_id'])
 
-prog_id_list = list(set(ancillary_05_df['Project GEF_ID'].astype('int').astype('str')))
+prog_id_list = id_set(ancillary_05_df['Project GEF_ID'], source='programmatic list')
 
 
 # =============================================================================
@@ -192,103 +178,50 @@ prog_id_list = list(set(ancillary_05_df['Project GEF_ID'].astype('int').astype('
 # -------------------------------------
 # build multi country and multi agency lists
 
-multicountry_id_list = list(set(ancillary_04_df.loc[ancillary_04_df["Country"].isin(["Regional", "Global"]), 'GEF_ID'].astype('int').astype('str')))
+multicountry_id_list = id_set(ancillary_04_df.loc[ancillary_04_df["Country"].isin(["Regional", "Global"]), 'GEF_ID'], source='gef projects multicountry')
 
-multiagency_id_list = list(set(ancillary_04_df.loc[ancillary_04_df["Secondary agency(ies)"].notnull(), 'GEF_ID'].astype('int').astype('str')))
+multiagency_id_list = id_set(ancillary_04_df.loc[ancillary_04_df["Secondary agency(ies)"].notnull(), 'GEF_ID'], source='gef projects multiagency')
 
 
 # -----------------------------------------------------------------------------
 # prepare new fields
 
-data_df = data_raw_df.copy(deep=True)
+# raw frame is not used past this point (and its rows were already copied
+# out of the csv read by the gef_id filter), so fields are added in place
+data_df = data_raw_df
+del data_raw_df
 
 
 # -------------------------------------
 # multiagency and multicountry
 
 # add multicountry and multiagency fields
-data_df['multicountry'] = [int(i) for i in data_df['gef_id'].isin(multicountry_id_list)]
-data_df['multiagency'] = [int(i) for i in data_df['gef_id'].isin(multiagency_id_list)]
+data_df['multicountry'] = in_set(data_df['gef_id'], multicountry_id_list).astype('int')
+data_df['multiagency'] = in_set(data_df['gef_id'], multiagency_id_list).astype('int')
 
 # assign random multicountry and multiagency to controls
-data_df.loc[data_df['type'] == 'rand', 'multicountry'] = np.random.randint(2, size=len(data_df['type'] == 'rand'))
-data_df.loc[data_df['type'] == 'rand', 'multiagency'] = np.random.randint(2, size=len(data_df['type'] == 'rand'))
+# (seeded so unchanged controls keep their flags and case fingerprints)
+control_flag_rng = np.random.RandomState(control_flag_seed)
+data_df.loc[data_df['type'] == 'rand', 'multicountry'] = control_flag_rng.randint(2, size=(data_df['type'] == 'rand').sum())
+data_df.loc[data_df['type'] == 'rand', 'multiagency'] = control_flag_rng.randint(2, size=(data_df['type'] == 'rand').sum())
 
 
 # -------------------------------------
 # implementation year
 
-# assign random year 2002-2013 to controls
-import random
-data_df.loc[data_df['type'] == 'rand', 'transactions_start_year'] = (
-    data_df.loc[data_df['type'] == 'rand'].apply(
-        lambda z: random.randint(2002, 2013), axis=1
-    )
-)
+# assign random year 2002-2013 to controls and attempt to find year
+# for non controls from (in order) transactions, implementation start,
+# ceo approval (MSP / EA), ceo endorsement (FP) and project approval dates,
+# using 2012 for non controls still missing year
+with step('start year') as s:
+    start_year_df = impute_start_year(data_df, random_range=(2002, 2013),
+                                      default_year=2012, seed=start_year_seed)
+    record_frame(s, start_year_df)
 
+data_df['transactions_start_year'] = start_year_df['transactions_start_year']
+data_df['start_year_source'] = start_year_df['start_year_source']
 
-# attempt to find year for non controls
-
-stage_00 = (
-    (data_df['type'] != 'rand')
-    & (data_df['transactions_start_year'] == ' ')
-)
-data_df.loc[stage_00, 'transactions_start_year'] = float('nan')
-
-def date_to_year(d):
-    partial = d.split('-')[2]
-    if int(partial) > 20:
-        y = '19'+ str(partial)
-    else:
-        y = '20' + str(partial)
-    return y
-
-
-stage_01 = (
-    (data_df['type'] != 'rand')
-    & (data_df['transactions_start_year'].isnull())
-    & (data_df['Actual date of implementation start'].notnull())
-)
-
-data_df.loc[stage_01, 'transactions_start_year'] = data_df.loc[stage_01]['Actual date of implementation start'].apply(lambda z: date_to_year(z))
-
-
-stage_02 = (
-    (data_df['type'] != 'rand')
-    & (data_df['transactions_start_year'].isnull())
-    & (data_df['Type acronym'].isin(['MSP', 'EA']))
-    & (data_df['Date of CEO approval (MSP / EA)'].notnull())
-)
-
-data_df.loc[stage_02, 'transactions_start_year'] = data_df.loc[stage_02]['Date of CEO approval (MSP / EA)'].apply(lambda z: date_to_year(z))
-
-
-stage_03 = (
-   (data_df['type'] != 'rand')
-    & (data_df['transactions_start_year'].isnull())
-    & (data_df['Type acronym'].isin(['FP']))
-    & (data_df['Date of CEO endorsement (FSP)'].notnull())
-)
-
-data_df.loc[stage_03, 'transactions_start_year'] = data_df.loc[stage_03]['Date of CEO endorsement (FSP)'].apply(lambda z: date_to_year(z))
-
-
-stage_04 = (
-    (data_df['type'] != 'rand')
-    & (data_df['transactions_start_year'].isnull())
-    & (data_df['Date of project approval'].notnull())
-)
-
-data_df.loc[stage_04, 'transactions_start_year'] = data_df.loc[stage_04]['Date of project approval'].apply(lambda z: date_to_year(z))
-
-
-# add year = 2012 to non control still missing year
-stage_05 = (
-    (data_df['type'] != 'rand')
-    & (data_df['transactions_start_year'].isnull())
-)
-
-data_df.loc[stage_05, 'transactions_start_year'] = 2012
+print data_df['start_year_source'].value_counts().to_dict()
 
 
 # drop location type = PCLI PCLD CONT
@@ -309,34 +242,19 @@ data_df['years_since_implementation'] = current_year - data_df['transactions_sta
 # ndvi pre-post difference
 
 
-def calc_ndvi_period_average(row, period):
-    total = 0
-    count = 0
-    start_year = int(row['transactions_start_year'])
-    if period == "pre":
-        years = range(start_year, 2014)
-    elif period == "post":
-        years = range(2000, start_year)
-    else:
-        raise Exception("Invalid ndvi period (use `pre` or `post`)")
-    for year in years:
-        cname = "ltdr_yearly_ndvi_mean.{0}.mean".format(year)
-        try:
-            total += float(row[cname])
-            count += 1
-        except:
-            pass
-    if count > 0:
-        return total / float(count)
-    else:
-        return float('nan')
-
+# per row windows over the yearly ndvi matrix (see ndvi.py)
+with step('ndvi averages') as s:
+    ndvi_stats_df = ndvi_period_stats(data_df)
+    record_frame(s, ndvi_stats_df)
 
 # average ndvi 2000:implementation (not including implmentation)
-data_df['ndvi_pre_average'] = data_df.apply(lambda z: calc_ndvi_period_average(z, period="pre"), axis=1)
+data_df['ndvi_pre_average'] = ndvi_stats_df['ndvi_pre_average']
 
 # average ndvi implementation:2013 (including 2013)
-data_df['ndvi_post_average'] = data_df.apply(lambda z: calc_ndvi_period_average(z, period="post"), axis=1)
+data_df['ndvi_post_average'] = ndvi_stats_df['ndvi_post_average']
+
+# least squares ndvi trend 2000:implementation (not including implementation)
+data_df['ndvi_pretrend_slope'] = ndvi_stats_df['ndvi_pretrend_slope']
 
 # difference
 data_df['ndvi_pre_post_diff'] = data_df['ndvi_pre_average'] - data_df['ndvi_post_average']
@@ -349,9 +267,10 @@ lossyr25_cols = [i for i in list(data_df.columns)
                  if i.startswith('lossyr25.na.categorical_')
                  and not i.endswith(('_count', '_noloss'))]
 
-data_df['lossyr25_sum'] = data_df[lossyr25_cols].sum(axis=1)
+with step('forest cover change'):
+    data_df['lossyr25_sum'] = data_df[lossyr25_cols].sum(axis=1)
 
-data_df['chg.forest.km.outcome'] = (data_df['lossyr25_sum'] / data_df['lossyr25.na.categorical_count']) *  (np.pi * 10**2)
+    data_df['chg.forest.km.outcome'] = (data_df['lossyr25_sum'] / data_df['lossyr25.na.categorical_count']) *  (np.pi * 10**2)
 
 
 # -------------------------------------
@@ -420,697 +339,117 @@ data_df["percent_bio_funding"] = data_df["GET_BD_"] / data_df["Total GEF grant a
 # output
 
 data_df_out = "{0}/data_prep/analysis_cases/base_data.csv".format(repo_dir)
-data_df.to_csv(data_df_out, index=False, encoding='utf-8')
+with step('write base data') as s:
+    base_out = data_df
+    if geometry_loc is not None:
+        base_out = with_geometry(data_df, loc=geometry_loc)
+    base_out.to_csv(data_df_out, index=False, encoding='utf-8')
+    record_frame(s, base_out)
+    del base_out
+
+# memory mapped copy of base data which case writers and analysis
+# scripts attach to instead of each holding a copy (see shared_table.py).
+# written with every base_data.csv (dry runs included) so the two match
+base_table_path = "{0}/data_prep/analysis_cases/base_data.arrow".format(repo_dir)
+with step('write base table'):
+    write_shared_table(data_df, base_table_path)
 
 
 # -----------------------------------------------------------------------------
 
 
-def build_case(case_id, treatment, control):
-    print "Running {0}".format(str(case_id).upper())
-    case_df = data_df.copy(deep=True)
-    case_df['treatment'] = -1
-    case_df.loc[treatment, 'treatment'] = 1
-    case_df.loc[control, 'treatment'] = 0
-    case_df = case_df.loc[case_df['treatment'] != -1]
-    return case_df
-
-
-def output_case(case_id, case_out, dry_run=dry_run):
-    print "Outputting {0}".format(str(case_id).upper())
-    case_path = "{0}/data_prep/analysis_cases/{1}_data.csv".format(repo_dir, case_id)
-    stats = {}
-    stats['treatment_count'] = sum(case_out['treatment'] == 1)
-    stats['control_count'] = sum(case_out['treatment'] == 0)
-    stats['total_count'] = len(case_out)
-    if not dry_run:
-        case_out.to_csv(case_path, index=False, encoding='utf-8')
+# gef id categories used as case terms (see case_definitions.py)
+case_id_sets = {
+    'prog': prog_id_list,
+    'land': union(land_nocd_id_list, land_component_id_list),
+    'bio': union(bio_nocd_id_list, bio_component_id_list),
+    'land_nocd': land_nocd_id_list,
+    'bio_nocd': bio_nocd_id_list,
+    'bio_component': bio_component_id_list,
+    'mfa_nocd': mfa_nocd_id_list,
+    'mfa_master': mfa_master_id_list
+}
+
+# evaluated once over base data (with the multicountry, multiagency and
+# gef phase flags), cases are bitwise combinations of the packed masks
+with step('case masks') as s:
+    case_index = build_bitmap_index(data_df, case_id_sets)
+    record_info(s, categories=len(case_index['names']))
+
+# saved for case count queries without rebuilding base data (case_query.py)
+case_index_path = "{0}/data_prep/analysis_cases/case_index.npz".format(repo_dir)
+if not dry_run:
+    save_case_index(case_index_path, case_index, data_df)
+
+
+def build_case(case):
+    print "Running {0}".format(str(case['name']).upper())
+    with step('build_case {0}'.format(case['name'])):
+        return case_treatment(case_index, case)
+
+
+def output_case(case, case_t, dry_run=dry_run):
+    case_id = case['name']
+    if case_export == 'csv':
+        case_path = "{0}/data_prep/analysis_cases/{1}_data.csv".format(repo_dir, case_id)
+        columns = None
+    else:
+        case_path = case_export_path(export_dir, case_id, case_export)
+        columns = case_columns(case, data_df.columns)
+    with step('output_case {0}'.format(case_id)) as s:
+        stats = case_counts(case_t)
+        record_info(s, **stats)
+        fingerprint = case_fingerprint(case, case_t, base_row_hash,
+                                       columns or data_df.columns,
+                                       export=case_export)
+        if case_is_current(case_manifest, case_id, case_path, fingerprint):
+            print "Skipping {0} (unchanged)".format(str(case_id).upper())
+        else:
+            print "Outputting {0}".format(str(case_id).upper())
+            # rows are only copied out of base data by the writer
+            pending_cases.append((case_id, case_path, case_t, columns, case_export))
+            case_manifest[case_id] = dict(stats, fingerprint=fingerprint)
     return stats
 
 
-# =============================================================================
-# =============================================================================
-# Example case
-#
-# Treatment:  Definitiion of treatment for `case_t`
-# Control:    Definitiion of control for `case_c`
-
-# case_name = "example"
-# print "Running Prog {0}".format(case_name.upper())
-# case_t = (
+# case partitioned columnar exports (case=<name>/part-0.<format>)
+export_dir = "{0}/data_prep/analysis_cases/{1}".format(repo_dir, case_export)
 
-# )
-# case_c = (
+# fingerprints of previously written cases
+manifest_path = "{0}/data_prep/analysis_cases/manifest.json".format(repo_dir)
+case_manifest = read_manifest(manifest_path)
 
-# )
-# case_df = build_case(case_name, case_t, case_c)
+with step('row hashes'):
+    base_row_hash = row_hashes(data_df)
 
-# Modify
-#
-
-# case_stats = output_case(case_name, case_df, dry_run=dry_run)
-# print case_stats
+pending_cases = []
 
 
 # =============================================================================
 # =============================================================================
-# programmatic
-
-
-# -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Treatment:  Programmatic w/ LD objectives
-# Control:    Null Case Comparisons
-
-# -------------------------------------
-case_name = "prog1vout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -------------------------------------
-
-case_name = "prog1fout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Treatment:  Programmatic w/ Biodiversity objectives
-# Control:    Null Case Comparisons
-
-# -------------------------------------
-case_name = "prog2vout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -------------------------------------
-case_name = "prog2fout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# # -------------------------------------
-# case_name = "prog2iout"
-# case_t = (
-#     (data_df['gef_id'].isin(prog_id_list))
-#     & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-# )
-# case_c = (
-#     (data_df['type'] == 'rand')
-# )
-# case_df = build_case(case_name, case_t, case_c)
-
-# # filter any units of observation that have a year of implementation > the last state score measurement
-# case_df = case_df.loc[(case_df['transactions_start_year'] > case_df['iba_year'])]
-# # start year >= 2008
-# case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-# case_stats = output_case(case_name, case_df, dry_run=dry_run)
-# print case_stats
-
-
-# -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Treatment:  Programmatic projects w/ LD objectives
-# Control:    Non-Programmatic projects w/ LD objectives
-
-# -------------------------------------
-case_name = "prog3vout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "prog3fout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Treatment:  Programmatic projects w/ Bio objectives
-# Control:    Non-Programmatic projects w/ Bio objectives
-
-# -------------------------------------
-case_name = "prog4vout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "prog4fout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# # -------------------------------------
-# case_name = "prog4iout"
-# case_t = (
-#    (data_df['gef_id'].isin(prog_id_list))
-#     & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-# )
-# case_c = (
-#    (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-#     & ~(data_df['gef_id'].isin(prog_id_list))
-# )
-# case_df = build_case(case_name, case_t, case_c)
-
-# # start year >= 2008
-# case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-# # filter any units of observation that have a year of implementation > the last state score measurement
-# # case_df = case_df.loc[(data_df['iba_start_diff'] > 0)]
-# # iba dist less than 2 decimal degrees or ~200km
-# # case_df = case_df.loc[(case_df['iba_distance'] < 2)]
-
-# case_stats = output_case(case_name, case_df, dry_run=dry_run)
-# print case_stats
-
-
-# -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Treatment:  Prog MFA LD with Monetary Threshold
-# Control:    Non-Prog MFA LD with Monetary Threshold
-
-# -------------------------------------
-case_name = "prog5vout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-# financials
-case_df = case_df.loc[
-	(case_df['GEF ID'].notnull())
-	& (case_df["percent_land_funding"] >= 1 / case_df["count_funding_categories"])
-]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "prog5fout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(land_nocd_id_list + land_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-# financials
-case_df = case_df.loc[
-	(case_df['GEF ID'].notnull())
-	& (case_df["percent_land_funding"] >= 1 / case_df["count_funding_categories"])
-]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Treatment:  Programmatic MFA Bio with Monetary Threshold
-# Control:    Non-Programmatic MFA Bio with Monetary Threshold
-
-# -------------------------------------
-case_name = "prog6vout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-# financials
-case_df = case_df.loc[
-	(case_df['GEF ID'].notnull())
-	& (case_df["percent_bio_funding"] >= 1 / case_df["count_funding_categories"])
-]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "prog6fout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list + bio_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-case_df = case_df.loc[
-	(case_df['GEF ID'].notnull())
-	& (case_df["percent_bio_funding"] >= 1 / case_df["count_funding_categories"])
-]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -----------------------------------------------------------------------------
-# -----------------------------------------------------------------------------
-# Treatment:  Programmatic SFA Bio
-# Control:    Non-Programmatic SFA Bio
-
-# -------------------------------------
-case_name = "prog7vout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list))
-    & (~data_df['gef_id'].isin(bio_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(bio_nocd_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "prog7fout"
-case_t = (
-    (data_df['gef_id'].isin(prog_id_list))
-    & (data_df['gef_id'].isin(bio_nocd_id_list))
-    & (~data_df['gef_id'].isin(bio_component_id_list))
-)
-case_c = (
-    (data_df['gef_id'].isin(bio_nocd_id_list))
-    & ~(data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# start year >= 2008
-case_df = case_df.loc[(case_df['transactions_start_year'] >= 2008)]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-
-# =============================================================================
-# =============================================================================
-# multi focal areas
-
-
-# -----------------------------------------------------------------------------
-# Treatment:  MFA Land projects with Monetary Threshold
-# Control:    Null Case Comparisons
-
-# -------------------------------------
-case_name = "mfa1vout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_land_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "mfa1fout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_land_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -----------------------------------------------------------------------------
-# Treatment:  MFA Land projects with Monetary Threshold
-# Control:    SFA Land
-
-# -------------------------------------
-case_name = "mfa2vout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_land_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['gef_id'].isin(land_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "mfa2fout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_land_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['gef_id'].isin(land_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -----------------------------------------------------------------------------
-# Treatment:  MFA Bio projects with Monetary Threshold
-# Control:    Null Case Comparisons
-
-# -------------------------------------
-case_name = "mfa3vout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_bio_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "mfa3fout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_bio_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -----------------------------------------------------------------------------
-# Treatment:  MFA Bio projects with Monetary Threshold
-# Control:    SFA Bio
-
-# -------------------------------------
-case_name = "mfa4vout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_bio_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['gef_id'].isin(bio_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# -------------------------------------
-case_name = "mfa4fout"
-case_t = (
-    (data_df['gef_id'].isin(mfa_nocd_id_list))
-    & (data_raw_df['GEF ID'].notnull())
-    & (data_df["percent_bio_funding"] >= 1 / data_df["count_funding_categories"])
-)
-case_c = (
-    (data_df['gef_id'].isin(bio_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_df = build_case(case_name, case_t, case_c)
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# =============================================================================
-# =============================================================================
-# biodiversity
-
-# -----------------------------------------------------------------------------
-# Treatment:  SFA Bio
-# Control:    Null Case Comparisons
-
-# -------------------------------------
-case_name = "bio1vout"
-case_t = (
-    (data_df['gef_id'].isin(bio_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "bio1fout"
-case_t = (
-    (data_df['gef_id'].isin(bio_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "bio1iout"
-case_t = (
-    (data_df['gef_id'].isin(bio_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# filter any units of observation that have a year of implementation > the last state score measurement
-case_df = case_df.loc[(case_df['transactions_start_year'] > case_df['iba_year'])]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-
-# =============================================================================
-# =============================================================================
-# land degradation
-
-# -----------------------------------------------------------------------------
-# Treatment:  SFA Land
-# Control:    Null Case Comparisons
-
-# -------------------------------------
-case_name = "land1vout"
-case_t = (
-    (data_df['gef_id'].isin(land_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-# drop rows without ndvi diff outcome values
-case_df = case_df.loc[case_df['ndvi_pre_post_diff'].notnull()]
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
-
-# -------------------------------------
-case_name = "land1fout"
-case_t = (
-    (data_df['gef_id'].isin(land_nocd_id_list))
-    & (~data_df['gef_id'].isin(mfa_master_id_list))
-    & (~data_df['gef_id'].isin(prog_id_list))
-)
-case_c = (
-    (data_df['type'] == 'rand')
-)
-case_df = build_case(case_name, case_t, case_c)
-
-case_stats = output_case(case_name, case_df, dry_run=dry_run)
-print case_stats
+# cases are declared in case_definitions.py
+#
+# Example case
+#
+# {'name': 'example',
+#  'treatment': ['prog', 'land'],
+#  'control': ['rand'],
+#  'filters': ['ndvi', 'start_2008']}
+
+
+for case in case_definitions:
+    case_t = build_case(case)
+    case_stats = output_case(case, case_t, dry_run=dry_run)
+    print case_stats
+
+
+# write changed cases in parallel
+if not dry_run:
+    with step('write cases') as s:
+        written = write_cases(data_df, pending_cases,
+                              table_path=base_table_path,
+                              geometry_loc=geometry_loc)
+        record_info(s, cases=len(written))
+    for case_id, write_time in written.items():
+        case_manifest[case_id]['written'] = write_time
+    write_manifest(manifest_path, case_manifest)
@@ -2,8 +2,13 @@
 
 import os
 import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
+
+from load_data import read_csv
+from lazy_geometry import with_geometry
+from gef_id_registry import parse_ids, id_text, invalid_key, failure_report
+from enrichment import build_lookup, enrich, fanout_report
+from iba_index import build_iba_tree, nearest_iba, iba_radius_features
+from profiling import step, record_frame
 
 
 if os.environ.get('USER') in ["vagrant", "ubuntu"]:
@@ -13,64 +18,96 @@ else:
     repo_dir = os.path.realpath(".")
 
 
-def read_csv(path):
-    '''read csv using pandas
-    '''
-    return pd.read_csv(path, quotechar='\"',
-                       na_values='', keep_default_na=False,
-                       encoding='utf-8')
+# radii (km) used for iba proximity features
+iba_radii = [10, 25, 50]
 
 
 # -------------------------------------
 # load data
 
+# every lookup table is indexed once on its key and its fields are
+# gathered onto the treatment rows (see enrichment.py). keys matching
+# several lookup rows are reported before rows are expanded
+
+# gef ids are matched on their parsed int64 key (see gef_id_registry.py),
+# kept in this field next to the source gef_id
+key_field = 'gef_key'
+
 # treatments extract data
 treatments_csv = "{0}/raw_data/merge_gef_treatments.csv".format(repo_dir)
-treatments_df = read_csv(treatments_csv)
-treatments_df['gef_id'] = treatments_df['gef_id'].astype('int').astype('str')
-data_df = treatments_df.copy(deep=True)
+with step('load treatments') as s:
+    treatments_df = read_csv(treatments_csv)
+    data_df = treatments_df.copy(deep=True)
+    data_df[key_field] = parse_ids(data_df['gef_id'], source='treatments gef_id')
+    record_frame(s, data_df)
 
 
 # get project location id by matching shapefile generated id
 treatments_location_id_csv = "{0}/raw_data/treatments_location_id.csv".format(repo_dir)
-treatments_location_id_df = read_csv(treatments_location_id_csv)
-treatments_location_id_df = treatments_location_id_df[['id', 'project_location_id']]
-data_df = data_df.merge(treatments_location_id_df, on='id')
+with step('merge location ids') as s:
+    treatments_location_id_df = read_csv(treatments_location_id_csv,
+                                         columns=['id', 'project_location_id'])
+    treatments_location_id_lookup = build_lookup(treatments_location_id_df, 'id')
+    data_df = enrich(data_df, treatments_location_id_lookup, how='inner',
+                     source='treatments_location_id id')
+    record_frame(s, data_df)
 
 
 # get round from project ancillary table
 projects_ancillary_csv = "{0}/raw_data/aiddata/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data/projects_ancillary.csv".format(repo_dir)
-projects_ancillary_df = read_csv(projects_ancillary_csv)
-projects_ancillary_df = projects_ancillary_df[['gef_id', 'round']]
-projects_ancillary_df['gef_id'] = projects_ancillary_df['gef_id'].astype('int').astype('str')
-data_df = data_df.merge(projects_ancillary_df, on='gef_id', how='left')
+with step('merge projects ancillary') as s:
+    projects_ancillary_df = read_csv(projects_ancillary_csv,
+                                     columns=['gef_id', 'round'])
+    projects_ancillary_df[key_field] = parse_ids(projects_ancillary_df.pop('gef_id'), source='projects_ancillary gef_id')
+    projects_ancillary_df = projects_ancillary_df.loc[projects_ancillary_df[key_field] != invalid_key]
+    projects_ancillary_lookup = build_lookup(projects_ancillary_df, key_field)
+    data_df = enrich(data_df, projects_ancillary_lookup,
+                     source='projects_ancillary gef_id')
+    record_frame(s, data_df)
 
 
 # get location type code from locations table
 locations_csv = "{0}/raw_data/aiddata/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data/locations.csv".format(repo_dir)
-locations_df = read_csv(locations_csv)
-locations_df = locations_df[['project_location_id', 'project_id', 'location_type_code']]
-data_df = data_df.merge(locations_df, on='project_location_id', how='left')
+with step('merge locations') as s:
+    locations_df = read_csv(locations_csv,
+                            columns=['project_location_id', 'project_id', 'location_type_code'])
+    locations_lookup = build_lookup(locations_df, 'project_location_id')
+    data_df = enrich(data_df, locations_lookup,
+                     source='locations project_location_id')
+    record_frame(s, data_df)
 
 # get year info from projects table
 projects_csv = "{0}/raw_data/aiddata/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data/projects.csv".format(repo_dir)
-projects_df = read_csv(projects_csv)
-projects_df = projects_df[['project_id', 'transactions_start_year', 'transactions_end_year', 'total_commitments', 'total_disbursements']]
-data_df = data_df.merge(projects_df, on='project_id', how='left')
+with step('merge projects') as s:
+    projects_df = read_csv(projects_csv,
+                           columns=['project_id', 'transactions_start_year', 'transactions_end_year', 'total_commitments', 'total_disbursements'])
+    projects_lookup = build_lookup(projects_df, 'project_id')
+    data_df = enrich(data_df, projects_lookup, source='projects project_id')
+    record_frame(s, data_df)
 
 
 # gef project info
 master_gef_projects_csv = "{0}/raw_data/ancillary/master_gef_projects.csv".format(repo_dir)
-master_gef_projects_df = read_csv(master_gef_projects_csv)
-master_gef_projects_df['gef_id'] = master_gef_projects_df['GEF_ID'].astype('int').astype('str')
-data_df = data_df.merge(master_gef_projects_df, on='gef_id', how='left')
+with step('merge master gef projects') as s:
+    master_gef_projects_df = read_csv(master_gef_projects_csv)
+    master_gef_projects_df[key_field] = parse_ids(master_gef_projects_df['GEF_ID'], source='master_gef_projects GEF_ID')
+    master_gef_projects_df = master_gef_projects_df.loc[master_gef_projects_df[key_field] != invalid_key]
+    master_gef_projects_lookup = build_lookup(master_gef_projects_df, key_field)
+    data_df = enrich(data_df, master_gef_projects_lookup,
+                     source='master_gef_projects gef_id')
+    record_frame(s, data_df)
 
 
 # mfa funding info
 funding_csv = "{0}/raw_data/ancillary/mfa_funding_breakdown.csv".format(repo_dir)
-funding_df = read_csv(funding_csv)
-funding_df['gef_id'] = funding_df['GEF ID'].astype('int').astype('str')
-data_df = data_df.merge(funding_df, on='gef_id', how='left')
+with step('merge mfa funding') as s:
+    funding_df = read_csv(funding_csv)
+    funding_df[key_field] = parse_ids(funding_df['GEF ID'], source='mfa_funding_breakdown GEF ID')
+    funding_df = funding_df.loc[funding_df[key_field] != invalid_key]
+    funding_lookup = build_lookup(funding_df, key_field)
+    data_df = enrich(data_df, funding_lookup,
+                     source='mfa_funding_breakdown gef_id')
+    record_frame(s, data_df)
 
 
 # data_df.to_csv(
@@ -79,93 +116,100 @@ data_df = data_df.merge(funding_df, on='gef_id', how='left')
 # raise
 
 
+# gef ids which could not be parsed to keys (treatment rows keep
+# invalid_key and match no lookup table)
+parse_failures_df = failure_report()
+if len(parse_failures_df):
+    print "Unparsed gef ids:"
+    print parse_failures_df.groupby('source').size().to_dict()
+
+# lookup keys which matched more than one lookup row (each adds rows)
+fanout_df = fanout_report()
+if len(fanout_df):
+    print "One to many lookup keys (rows added):"
+    print fanout_df.groupby('source')['added_rows'].sum().to_dict()
+
+
 # assign types
-data_df.loc[data_df['round'] == "Programmatic", 'type'] = 'prog'
-data_df.loc[data_df['round'] == "MFA", 'type'] = 'mfa'
-data_df.loc[data_df['round'] == "Biodiversity", 'type'] = 'bio'
-data_df.loc[data_df['round'] == "Land Degradation", 'type'] = 'land'
-data_df.loc[data_df['project_location_id'].isnull(), 'type'] = 'ext_bio'
+with step('assign types'):
+    data_df.loc[data_df['round'] == "Programmatic", 'type'] = 'prog'
+    data_df.loc[data_df['round'] == "MFA", 'type'] = 'mfa'
+    data_df.loc[data_df['round'] == "Biodiversity", 'type'] = 'bio'
+    data_df.loc[data_df['round'] == "Land Degradation", 'type'] = 'land'
+    data_df.loc[data_df['project_location_id'].isnull(), 'type'] = 'ext_bio'
 
 
 # controls
 controls_csv = "{0}/raw_data/merge_gef_controls.csv".format(repo_dir)
-controls_df = read_csv(controls_csv)
-controls_df['type'] = 'rand'
-
+with step('concat controls') as s:
+    controls_df = read_csv(controls_csv)
+    controls_df['type'] = 'rand'
 
-# concat all data
-merged_df = pd.concat([data_df, controls_df])
+    # gef_id is written as text so it stays integral next to the
+    # controls (which have no gef id)
+    data_df['gef_id'] = id_text(data_df['gef_id'])
+    data_df = data_df.drop(key_field, axis=1)
 
+    # concat all data
+    merged_df = pd.concat([data_df, controls_df])
 
+    col_first = ['gef_id', 'project_location_id', 'type', 'id', 'longitude', 'latitude']
+    col_mid = sorted(list(set(list(treatments_df.columns)) - set(col_first)))
+    col_last = [i for i in list(data_df.columns) if i not in col_first + col_mid]
+    merged_df = merged_df[col_first + col_mid + col_last]
+    record_frame(s, merged_df)
 
-col_first = ['gef_id', 'project_location_id', 'type', 'id', 'longitude', 'latitude']
-col_mid = sorted(list(set(list(treatments_df.columns)) - set(col_first)))
-col_last = [i for i in list(data_df.columns) if i not in col_first + col_mid]
-merged_df = merged_df[col_first + col_mid + col_last]
+# coordinates stay as longitude/latitude arrays, the wkt geometry field
+# (following the merged fields) is only built when writing output
+# (see lazy_geometry.py)
+geometry_loc = merged_df.shape[1]
 
 
 # -------------------------------------
 
 
 # add iba field
-merged_gdf = gpd.GeoDataFrame(merged_df)
-merged_gdf.geometry = merged_gdf.apply(lambda z: Point(z.longitude, z.latitude), axis=1)
-
-
 iba_csv = "{0}/raw_data/iba/IBA monitoring data 4 Nov 2015.csv".format(repo_dir)
-iba_raw_df = read_csv(iba_csv)
-
-# drop statescore 5 (areas that were not assessed) and
-# sort by year and only keep last one
-# to get rid of multiples for each site
-iba_df = iba_raw_df.copy(deep=True)
-
-iba_df = iba_df.loc[(iba_df['StateScore'] != 5)]
-iba_df = iba_df.sort_values(by='MonitoringYear', ascending=1)
-iba_df = iba_df.groupby('SiteID').last()
-
-# convert to geodataframe
-iba_gdf = gpd.GeoDataFrame(iba_df)
-iba_gdf.geometry = iba_gdf.apply(lambda z: Point(z.Longitude, z.Latitude), axis=1)
-
-
-# actual values for assessed areas are 0-3
-merged_gdf['iba_statescore'] = -1
-merged_gdf['iba_distance'] = -1
-merged_gdf['iba_area'] = -1
-merged_gdf['iba_year'] = -1
-
-iba_distance = []
-iba_statescore = []
-iba_area = []
-iba_year = []
-
-for i in range(len(merged_gdf)):
-    # run distance check
-    distance_vals = iba_gdf.geometry.distance(merged_gdf.iloc[i].geometry)
-    distance_vals.sort_values(inplace=True)
-    # get vals
-    ix = distance_vals.index[0]
-    distance = distance_vals.iloc[0]
-    score = iba_gdf.loc[ix]['StateScore']
-    area = iba_gdf.loc[ix]['Area']
-    year = iba_gdf.loc[ix]['MonitoringYear']
-    # append
-    iba_distance.append(distance)
-    iba_statescore.append(score)
-    iba_area.append(area)
-    iba_year.append(year)
-
-
-merged_gdf['iba_distance'] = iba_distance
-merged_gdf['iba_statescore'] = iba_statescore
-merged_gdf['iba_area'] = iba_area
-merged_gdf['iba_year'] = iba_year
-
-
-merged_out = pd.DataFrame(merged_gdf)
+with step('load iba') as s:
+    iba_raw_df = read_csv(iba_csv)
+
+    # drop statescore 5 (areas that were not assessed) and
+    # sort by year and only keep last one
+    # to get rid of multiples for each site
+    iba_df = iba_raw_df.copy(deep=True)
+
+    iba_df = iba_df.loc[(iba_df['StateScore'] != 5)]
+    iba_df = iba_df.sort_values(by='MonitoringYear', ascending=1)
+    iba_df = iba_df.groupby('SiteID').last()
+    record_frame(s, iba_df)
+
+# nearest iba site for every merged row (single batched query)
+with step('iba nearest') as s:
+    iba_tree = build_iba_tree(iba_df)
+    iba_nearest_df = nearest_iba(iba_tree, iba_df,
+                                 merged_df['longitude'], merged_df['latitude'])
+
+    # actual values for assessed areas are 0-3
+    # iba_distance is great circle distance in km
+    for c in iba_nearest_df.columns:
+        merged_df[c] = iba_nearest_df[c].values
+    record_frame(s, iba_nearest_df)
+
+# count, total area and mean state score of iba sites within each radius
+with step('iba radius features') as s:
+    iba_radius_df = iba_radius_features(iba_tree, iba_df,
+                                        merged_df['longitude'], merged_df['latitude'],
+                                        radii=iba_radii)
+
+    for c in iba_radius_df.columns:
+        merged_df[c] = iba_radius_df[c].values
+    record_frame(s, iba_radius_df)
+
 
 # output data
 out_path = "{0}/data_prep/merged_data.csv".format(repo_dir)
-merged_out.to_csv(out_path, index=False, encoding='utf-8')
+with step('write merged data') as s:
+    merged_out = with_geometry(merged_df, loc=geometry_loc)
+    merged_out.to_csv(out_path, index=False, encoding='utf-8')
+    record_frame(s, merged_out)
 
@@ -0,0 +1,71 @@
+"""
+protected area containment / proximity of every merged location
+
+each treatment and control location in merged_data.csv is joined against
+the wdpa polygons (see wdpa_index.py): whether it falls inside any
+protected area (and which one) and the distance to the closest protected
+area within the largest of `wdpa_radii` km.
+
+result is saved as wdpa_join.csv with one row per merged_data row (in the
+same order) keyed by gef_id, project_location_id, type and id
+"""
+
+import os
+
+from load_data import read_csv
+from gef_id_registry import id_text
+from wdpa_index import load_wdpa_polygons, build_wdpa_tree, wdpa_join
+from profiling import step, record_frame
+
+
+if os.environ.get('USER') in ["vagrant", "ubuntu"]:
+    repo_dir = os.path.dirname(
+        os.path.dirname(os.path.realpath(__file__)))
+else:
+    repo_dir = os.path.realpath(".")
+
+
+# radii (km) used for protected area proximity flags
+wdpa_radii = [1, 5, 10]
+
+key_fields = ['gef_id', 'project_location_id', 'type', 'id']
+
+
+data_csv = "{0}/data_prep/merged_data.csv".format(repo_dir)
+with step('load merged locations') as s:
+    data_df = read_csv(data_csv, columns=key_fields + ['longitude', 'latitude'])
+    record_frame(s, data_df)
+
+
+# polygon store is cached next to shapefile and only rebuilt when the
+# shapefile changes
+wdpa_shp_path = "{0}/raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.shp".format(repo_dir)
+wdpa_cache_path = "{0}/raw_data/wdpa/shps/WDPA_Dec2016_poly_simp_polygons.feather".format(repo_dir)
+with step('wdpa polygons') as s:
+    polygon_df = load_wdpa_polygons(wdpa_shp_path, wdpa_cache_path)
+    record_frame(s, polygon_df)
+
+with step('wdpa tree'):
+    wdpa_tree, wdpa_geoms = build_wdpa_tree(polygon_df)
+
+with step('wdpa join') as s:
+    join_df = wdpa_join(wdpa_tree, wdpa_geoms, polygon_df,
+                        data_df['longitude'], data_df['latitude'],
+                        radii=wdpa_radii)
+    record_frame(s, join_df)
+
+print "Locations in protected areas: {0} of {1}".format(
+    int(join_df['wdpa_in'].sum()), len(join_df))
+
+
+for c in key_fields:
+    join_df.insert(key_fields.index(c), c, data_df[c].values)
+
+# gef_id is read as float (controls have no id), written as integer text
+# as in merged_data.csv
+join_df['gef_id'] = id_text(join_df['gef_id'])
+
+out_path = "{0}/data_prep/wdpa_join.csv".format(repo_dir)
+with step('write wdpa join') as s:
+    join_df.to_csv(out_path, index=False, encoding='utf-8')
+    record_frame(s, join_df)
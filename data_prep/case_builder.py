@@ -0,0 +1,321 @@
+"""
+mask based analysis case builder
+
+every gef id category, flag field and row predicate used by the case
+definitions is evaluated once over the shared base frame into a bitmap
+index (one bit packed mask per category). cases are then bitwise
+AND / OR / NOT combinations of those packed masks, and rows are only
+copied out of the base frame when a case is written.
+
+case outputs are fingerprinted (definition + hashes of the selected rows)
+so unchanged cases are not rewritten, and the remaining cases are written
+across a process pool, either as csv with every base field or as case
+partitioned parquet / feather exports with only the fields of the case
+outcome family (see case_definitions.py). base data holds no geometry, the
+wkt geometry field of csv cases is built from the coordinates of the case
+rows by the writer (see lazy_geometry.py).
+"""
+
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from gef_id_registry import in_set
+from shared_table import attach_shared_table, shared_frame
+from lazy_geometry import with_geometry
+from case_definitions import (export_id_columns, export_covariate_columns,
+                              outcome_columns)
+
+
+# row level predicates which can be used as case terms
+row_predicates = {
+    # random control points
+    'rand': lambda df: df['type'] == 'rand',
+    # rows with ndvi diff outcome values
+    'ndvi': lambda df: df['ndvi_pre_post_diff'].notnull(),
+    # start year >= 2008
+    'start_2008': lambda df: df['transactions_start_year'] >= 2008,
+    # mfa financials with land/bio funding share above even split
+    'land_funding': lambda df: (
+        df['GEF ID'].notnull()
+        & (df['percent_land_funding'] >= 1 / df['count_funding_categories'])),
+    'bio_funding': lambda df: (
+        df['GEF ID'].notnull()
+        & (df['percent_bio_funding'] >= 1 / df['count_funding_categories'])),
+    # year of implementation after last state score measurement
+    'iba_after': lambda df: df['transactions_start_year'] > df['iba_year']
+}
+
+
+# base data fields (0/1) which are held as category bits
+flag_fields = [
+    'multicountry', 'multiagency', 'gef_phase_3', 'gef_phase_4',
+    'gef_phase_5', 'gef_phase_6', 'gef_phase_other'
+]
+
+
+def pack_mask(mask):
+    '''bit packed boolean mask (8 rows per byte)
+    '''
+    return np.packbits(np.asarray(mask, dtype='bool'))
+
+
+def unpack_mask(index, bits):
+    '''boolean mask of base rows from bit packed mask
+    '''
+    return np.unpackbits(bits)[:index['size']].astype('bool')
+
+
+def build_bitmap_index(data_df, id_sets, flags=flag_fields):
+    '''bitmap index of every category, flag and row predicate
+
+    id_sets maps category name to array of gef id keys and flags are base
+    data fields where non zero values set the bit. returns dict with the
+    category names, number of rows and a (categories, rows / 8) uint8
+    array with the bit packed mask of each category
+    '''
+    masks = OrderedDict()
+    gef_keys = data_df['gef_id'].values
+    for name in sorted(id_sets):
+        masks[name] = in_set(gef_keys, id_sets[name])
+    for name in flags:
+        if name in data_df.columns:
+            masks[name] = data_df[name].fillna(0).values != 0
+    for name in sorted(row_predicates):
+        masks[name] = np.asarray(row_predicates[name](data_df), dtype='bool')
+
+    size = len(data_df)
+    bits = np.zeros((len(masks), (size + 7) // 8), dtype='uint8')
+    for i, mask in enumerate(masks.values()):
+        bits[i] = pack_mask(mask)
+    return {'names': list(masks.keys()), 'size': size, 'bits': bits}
+
+
+def term_bits(index, term):
+    '''bit packed mask of case term
+
+    "~" prefix negates term and "|" separates alternatives (any of)
+    '''
+    negate = term.startswith('~')
+    bits = None
+    for name in term.lstrip('~').split('|'):
+        if name not in index['names']:
+            raise KeyError("Unknown case term: {0}".format(name))
+        b = index['bits'][index['names'].index(name)]
+        bits = b if bits is None else bits | b
+    return ~bits if negate else bits
+
+
+def eval_terms(index, terms):
+    '''bit packed AND of case terms
+    '''
+    result = np.full(index['bits'].shape[1], 0xff, dtype='uint8')
+    for term in terms:
+        result &= term_bits(index, term)
+    return result
+
+
+def case_treatment(index, case):
+    '''treatment value of every base row for case
+
+    1 for treatment, 0 for control and -1 for rows not in case
+    '''
+    f = eval_terms(index, case.get('filters', []))
+    t = eval_terms(index, case['treatment']) & f
+    c = eval_terms(index, case['control']) & f
+
+    treatment = np.full(index['size'], -1, dtype='int8')
+    treatment[unpack_mask(index, t)] = 1
+    treatment[unpack_mask(index, c)] = 0
+    return treatment
+
+
+def case_counts(treatment):
+    '''treatment/control/total counts from case treatment array
+    '''
+    stats = {}
+    stats['treatment_count'] = int((treatment == 1).sum())
+    stats['control_count'] = int((treatment == 0).sum())
+    stats['total_count'] = stats['treatment_count'] + stats['control_count']
+    return stats
+
+
+def materialize_case(data_df, treatment, columns=None):
+    '''copy rows in case out of base frame with treatment field set
+
+    only the given columns (in order) are copied if columns is set
+    '''
+    selected = treatment != -1
+    if columns is None:
+        return data_df.loc[selected].assign(treatment=treatment[selected])
+    base_columns = [c for c in columns if c != 'treatment']
+    case_df = data_df.loc[selected, base_columns]
+    return case_df.assign(treatment=treatment[selected])[columns]
+
+
+def case_columns(case, columns):
+    '''fields of columnar case export
+
+    id and covariate fields plus the outcome fields of the case outcome
+    family ('outcome' key or case name suffix), limited to fields found
+    in columns (treatment is always included)
+    '''
+    family = case.get('outcome', case['name'][-4:])
+    if family not in outcome_columns:
+        raise ValueError("Unknown outcome family for case {0}: {1}".format(
+            case['name'], family))
+    available = set(columns) | set(['treatment'])
+    wanted = export_id_columns + export_covariate_columns + outcome_columns[family]
+    return [c for c in OrderedDict.fromkeys(wanted) if c in available]
+
+
+# -----------------------------------------------------------------------------
+# case output
+
+def row_hashes(data_df):
+    '''uint64 hash of every base row (all columns)
+    '''
+    return pd.util.hash_pandas_object(data_df, index=False).values
+
+
+def case_fingerprint(case, treatment, row_hash, columns, export='csv'):
+    '''fingerprint of case output
+
+    combines case definition, output format/columns and the
+    hashes/treatment values of the rows selected for the case
+    '''
+    selected = treatment != -1
+    sha = hashlib.sha1()
+    sha.update(json.dumps(case, sort_keys=True).encode('utf-8'))
+    sha.update(export.encode('utf-8'))
+    sha.update(json.dumps([str(c) for c in columns]).encode('utf-8'))
+    sha.update(np.ascontiguousarray(row_hash[selected]).tobytes())
+    sha.update(np.ascontiguousarray(treatment[selected]).tobytes())
+    return sha.hexdigest()
+
+
+def read_manifest(manifest_path):
+    '''case manifest (empty if none exists yet)
+    '''
+    if not os.path.isfile(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(manifest_path, manifest):
+    '''save case manifest
+    '''
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+
+
+def case_is_current(manifest, case_id, case_path, fingerprint):
+    '''check if existing case output matches fingerprint
+    '''
+    return (case_id in manifest
+            and manifest[case_id]['fingerprint'] == fingerprint
+            and os.path.isfile(case_path))
+
+
+# base frame shared with case writer processes
+shared_data_df = None
+
+# position of geometry field in csv cases (None for no geometry)
+shared_geometry_loc = None
+
+
+def init_case_writer(data_df, geometry_loc=None):
+    '''pool initializer, make base frame available to worker
+    '''
+    global shared_data_df, shared_geometry_loc
+    shared_data_df = data_df
+    shared_geometry_loc = geometry_loc
+
+
+def attach_case_writer(table_path, geometry_loc=None):
+    '''pool initializer, attach worker to memory mapped base table
+    '''
+    init_case_writer(shared_frame(attach_shared_table(table_path)),
+                     geometry_loc)
+
+
+def case_export_path(export_dir, case_id, export):
+    '''path of case in case partitioned columnar export
+    '''
+    return os.path.join(export_dir, 'case={0}'.format(case_id),
+                        'part-0.{0}'.format(export))
+
+
+def write_frame(df, path, export):
+    '''write frame as csv, parquet or feather
+    '''
+    if export == 'csv':
+        df.to_csv(path, index=False, encoding='utf-8')
+        return
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    if export == 'parquet':
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+    elif export == 'feather':
+        # feather writer of older pyarrow only takes a frame (default index)
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        raise ValueError("Unknown case export format: {0}".format(export))
+
+
+def write_case(task):
+    '''materialize case from shared base frame and write it
+    '''
+    case_id, case_path, treatment, columns, export = task
+    case_out = materialize_case(shared_data_df, treatment, columns=columns)
+    if columns is None and shared_geometry_loc is not None:
+        case_out = with_geometry(case_out, loc=shared_geometry_loc)
+    write_frame(case_out, case_path, export)
+    return case_id
+
+
+def write_cases(data_df, tasks, processes=None, table_path=None,
+                geometry_loc=None):
+    '''write cases across a process pool
+
+    tasks are (case_id, case_path, treatment, columns, export) where
+    columns is None for all base fields and export is the output format.
+    when table_path (shared base table, see shared_table.py) is given
+    workers attach to it instead of receiving a copy of data_df. cases
+    with all base fields get a geometry field at geometry_loc if set
+
+    returns dict of case id to write time
+    '''
+    if processes is None:
+        processes = cpu_count()
+
+    written = {}
+    if processes > 1 and len(tasks) > 1:
+        if table_path is not None:
+            init, initargs = attach_case_writer, (table_path, geometry_loc)
+        else:
+            init, initargs = init_case_writer, (data_df, geometry_loc)
+        pool = Pool(min(processes, len(tasks)),
+                    initializer=init, initargs=initargs)
+        try:
+            for case_id in pool.imap_unordered(write_case, tasks):
+                written[case_id] = time.strftime('%Y-%m-%d %H:%M:%S')
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        init_case_writer(data_df, geometry_loc)
+        for task in tasks:
+            case_id = write_case(task)
+            written[case_id] = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    return written
@@ -0,0 +1,264 @@
+"""
+analysis case definitions
+
+each case is declared as data:
+
+    name        case id (output is `{name}_data.csv`)
+    treatment   terms which must all be true for treatment rows
+    control     terms which must all be true for control rows
+    filters     terms which must all be true for any row kept in case
+
+terms are names of gef id categories, flag fields or row predicates (see
+case_builder.py), prefixed with "~" for negation. alternatives within a
+term are separated with "|" (e.g. "multicountry|multiagency"). rows
+matching both treatment and control are controls.
+"""
+
+
+case_definitions = [
+
+    # =========================================================================
+    # =========================================================================
+    # programmatic
+
+    # -------------------------------------------------------------------------
+    # Treatment:  Programmatic w/ LD objectives
+    # Control:    Null Case Comparisons
+    {'name': 'prog1vout',
+     'treatment': ['prog', 'land'],
+     'control': ['rand'],
+     'filters': ['ndvi', 'start_2008']},
+
+    {'name': 'prog1fout',
+     'treatment': ['prog', 'land'],
+     'control': ['rand'],
+     'filters': ['start_2008']},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  Programmatic w/ Biodiversity objectives
+    # Control:    Null Case Comparisons
+    {'name': 'prog2vout',
+     'treatment': ['prog', 'bio'],
+     'control': ['rand'],
+     'filters': ['ndvi', 'start_2008']},
+
+    {'name': 'prog2fout',
+     'treatment': ['prog', 'bio'],
+     'control': ['rand'],
+     'filters': ['start_2008']},
+
+    # {'name': 'prog2iout',
+    #  'treatment': ['prog', 'bio'],
+    #  'control': ['rand'],
+    #  'filters': ['iba_after', 'start_2008']},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  Programmatic projects w/ LD objectives
+    # Control:    Non-Programmatic projects w/ LD objectives
+    {'name': 'prog3vout',
+     'treatment': ['prog', 'land'],
+     'control': ['land', '~prog'],
+     'filters': ['ndvi', 'start_2008']},
+
+    {'name': 'prog3fout',
+     'treatment': ['prog', 'land'],
+     'control': ['land', '~prog'],
+     'filters': ['start_2008']},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  Programmatic projects w/ Bio objectives
+    # Control:    Non-Programmatic projects w/ Bio objectives
+    {'name': 'prog4vout',
+     'treatment': ['prog', 'bio'],
+     'control': ['bio', '~prog'],
+     'filters': ['ndvi', 'start_2008']},
+
+    {'name': 'prog4fout',
+     'treatment': ['prog', 'bio'],
+     'control': ['bio', '~prog'],
+     'filters': ['start_2008']},
+
+    # {'name': 'prog4iout',
+    #  'treatment': ['prog', 'bio'],
+    #  'control': ['bio', '~prog'],
+    #  'filters': ['start_2008']},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  Prog MFA LD with Monetary Threshold
+    # Control:    Non-Prog MFA LD with Monetary Threshold
+    {'name': 'prog5vout',
+     'treatment': ['prog', 'land'],
+     'control': ['mfa_nocd', '~prog'],
+     'filters': ['ndvi', 'start_2008', 'land_funding']},
+
+    {'name': 'prog5fout',
+     'treatment': ['prog', 'land'],
+     'control': ['mfa_nocd', '~prog'],
+     'filters': ['start_2008', 'land_funding']},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  Programmatic MFA Bio with Monetary Threshold
+    # Control:    Non-Programmatic MFA Bio with Monetary Threshold
+    {'name': 'prog6vout',
+     'treatment': ['prog', 'bio'],
+     'control': ['mfa_nocd', '~prog'],
+     'filters': ['ndvi', 'start_2008', 'bio_funding']},
+
+    {'name': 'prog6fout',
+     'treatment': ['prog', 'bio'],
+     'control': ['mfa_nocd', '~prog'],
+     'filters': ['start_2008', 'bio_funding']},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  Programmatic SFA Bio
+    # Control:    Non-Programmatic SFA Bio
+    {'name': 'prog7vout',
+     'treatment': ['prog', 'bio_nocd', '~bio_component'],
+     'control': ['bio_nocd', '~prog'],
+     'filters': ['ndvi', 'start_2008']},
+
+    {'name': 'prog7fout',
+     'treatment': ['prog', 'bio_nocd', '~bio_component'],
+     'control': ['bio_nocd', '~prog'],
+     'filters': ['start_2008']},
+
+
+    # =========================================================================
+    # =========================================================================
+    # multi focal areas
+
+    # -------------------------------------------------------------------------
+    # Treatment:  MFA Land projects with Monetary Threshold
+    # Control:    Null Case Comparisons
+    {'name': 'mfa1vout',
+     'treatment': ['mfa_nocd', 'land_funding'],
+     'control': ['rand'],
+     'filters': ['ndvi']},
+
+    {'name': 'mfa1fout',
+     'treatment': ['mfa_nocd', 'land_funding'],
+     'control': ['rand'],
+     'filters': []},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  MFA Land projects with Monetary Threshold
+    # Control:    SFA Land
+    {'name': 'mfa2vout',
+     'treatment': ['mfa_nocd', 'land_funding'],
+     'control': ['land_nocd', '~mfa_master', '~prog'],
+     'filters': ['ndvi']},
+
+    {'name': 'mfa2fout',
+     'treatment': ['mfa_nocd', 'land_funding'],
+     'control': ['land_nocd', '~mfa_master', '~prog'],
+     'filters': []},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  MFA Bio projects with Monetary Threshold
+    # Control:    Null Case Comparisons
+    {'name': 'mfa3vout',
+     'treatment': ['mfa_nocd', 'bio_funding'],
+     'control': ['rand'],
+     'filters': ['ndvi']},
+
+    {'name': 'mfa3fout',
+     'treatment': ['mfa_nocd', 'bio_funding'],
+     'control': ['rand'],
+     'filters': []},
+
+    # -------------------------------------------------------------------------
+    # Treatment:  MFA Bio projects with Monetary Threshold
+    # Control:    SFA Bio
+    {'name': 'mfa4vout',
+     'treatment': ['mfa_nocd', 'bio_funding'],
+     'control': ['bio_nocd', '~mfa_master', '~prog'],
+     'filters': ['ndvi']},
+
+    {'name': 'mfa4fout',
+     'treatment': ['mfa_nocd', 'bio_funding'],
+     'control': ['bio_nocd', '~mfa_master', '~prog'],
+     'filters': []},
+
+
+    # =========================================================================
+    # =========================================================================
+    # biodiversity
+
+    # -------------------------------------------------------------------------
+    # Treatment:  SFA Bio
+    # Control:    Null Case Comparisons
+    {'name': 'bio1vout',
+     'treatment': ['bio_nocd', '~mfa_master', '~prog'],
+     'control': ['rand'],
+     'filters': ['ndvi']},
+
+    {'name': 'bio1fout',
+     'treatment': ['bio_nocd', '~mfa_master', '~prog'],
+     'control': ['rand'],
+     'filters': []},
+
+    {'name': 'bio1iout',
+     'treatment': ['bio_nocd', '~mfa_master', '~prog'],
+     'control': ['rand'],
+     'filters': ['iba_after']},
+
+
+    # =========================================================================
+    # =========================================================================
+    # land degradation
+
+    # -------------------------------------------------------------------------
+    # Treatment:  SFA Land
+    # Control:    Null Case Comparisons
+    {'name': 'land1vout',
+     'treatment': ['land_nocd', '~mfa_master', '~prog'],
+     'control': ['rand'],
+     'filters': ['ndvi']},
+
+    {'name': 'land1fout',
+     'treatment': ['land_nocd', '~mfa_master', '~prog'],
+     'control': ['rand'],
+     'filters': []},
+
+]
+
+
+# -----------------------------------------------------------------------------
+# columnar case exports
+#
+# columnar exports (see case_builder.py) only carry the id fields, the
+# covariates used by the matching jobs (analysis/round_02) and the outcome
+# fields of the case outcome family (case name suffix, or 'outcome' key)
+
+export_id_columns = [
+    'gef_id', 'project_location_id', 'type', 'treatment', 'GEF_ID', 'Title',
+    'transactions_start_year'
+]
+
+export_covariate_columns = [
+    'dist_to_all_rivers.na.mean', 'dist_to_roads.na.mean',
+    'srtm_elevation_500m.na.mean', 'srtm_slope_500m.na.mean',
+    'accessibility_map.na.mean', 'gpw_v3_density.2000.mean',
+    'wdpa_5km.na.sum', 'treecover2000.na.mean', 'latitude', 'longitude',
+    'udel_precip_v4_01_yearly_max.2002.mean',
+    'udel_precip_v4_01_yearly_min.2002.mean',
+    'udel_precip_v4_01_yearly_mean.2002.mean',
+    'udel_air_temp_v4_01_yearly_max.2002.mean',
+    'udel_air_temp_v4_01_yearly_min.2002.mean',
+    'udel_air_temp_v4_01_yearly_mean.2002.mean',
+    'v4composites_calibrated.2002.mean', 'ltdr_yearly_ndvi_mean.2002.mean',
+    'years_since_implementation', 'total_commitments', 'multicountry',
+    'multiagency', 'gef_phase_3', 'gef_phase_4', 'gef_phase_5',
+    'gef_phase_6', 'gef_phase_other'
+]
+
+outcome_columns = {
+    # ndvi pre/post implementation
+    'vout': ['ndvi_pre_post_diff', 'ndvi_pre_average', 'ndvi_post_average',
+             'ndvi_pretrend_slope'],
+    # hansen forest loss
+    'fout': ['chg.forest.km.outcome', 'lossyr25_sum',
+             'lossyr25.na.categorical_count'],
+    # iba state score
+    'iout': ['iba_statescore', 'iba_distance', 'iba_year', 'iba_start_diff']
+}
@@ -0,0 +1,197 @@
+"""
+case count queries over the cached case index
+
+build_analysis_cases.py saves the bitmap index of base data categories
+(see case_builder.py) together with a few per row fields (type, start
+year, gef id) to analysis_cases/case_index.npz. candidate case definitions
+can then be counted from the packed masks alone, without loading base data
+or building any frame:
+
+    treatment / control / total counts
+    unique treatment / control projects
+    treatment / control counts by type and by start year
+
+usage (from repo root):
+
+    python data_prep/case_query.py prog1vout mfa2fout    # declared cases
+    python data_prep/case_query.py --all                 # every declared case
+    python data_prep/case_query.py -t prog land -c rand -f ndvi start_2008
+    python data_prep/case_query.py --terms               # available terms
+"""
+
+import os
+import json
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from case_builder import eval_terms, unpack_mask
+
+
+if os.environ.get('USER') in ["vagrant", "ubuntu"]:
+    repo_dir = os.path.dirname(
+        os.path.dirname(os.path.realpath(__file__)))
+else:
+    repo_dir = os.path.realpath(".")
+
+
+# per row base data fields saved with the index for distributions
+query_fields = ['type', 'transactions_start_year', 'gef_id']
+
+# number of set bits of every byte value
+popcount_table = np.array([bin(i).count('1') for i in range(256)],
+                          dtype='uint8')
+
+text_type = type(u'')
+
+
+def text_labels(values):
+    '''unicode text of each value (byte strings decoded as utf-8)
+    '''
+    return np.array([v if isinstance(v, text_type)
+                     else v.decode('utf-8') if isinstance(v, bytes)
+                     else text_type(v) for v in values], dtype=text_type)
+
+
+def save_case_index(path, index, data_df, fields=query_fields):
+    '''save bitmap index and query fields of base data
+
+    string fields are saved as integer codes and unicode labels
+    '''
+    arrays = {
+        'names': np.array(index['names']),
+        'size': np.array(index['size']),
+        'bits': index['bits']
+    }
+    for field in fields:
+        values = np.asarray(data_df[field])
+        if values.dtype.kind in 'iuf':
+            arrays['values_' + field] = values
+        else:
+            labels, codes = np.unique(text_labels(values),
+                                      return_inverse=True)
+            arrays['codes_' + field] = codes.astype('int32')
+            arrays['labels_' + field] = labels
+    np.savez(path, **arrays)
+
+
+def load_case_index(path):
+    '''bitmap index and query fields saved by save_case_index
+
+    returns (index, fields) where fields maps field name to array of
+    values (or (codes, labels) for string fields)
+    '''
+    npz = np.load(path)
+    index = {
+        'names': [str(n) for n in npz['names']],
+        'size': int(npz['size']),
+        'bits': npz['bits']
+    }
+    fields = {}
+    for key in npz.files:
+        if key.startswith('values_'):
+            fields[key[len('values_'):]] = npz[key]
+        elif key.startswith('codes_'):
+            field = key[len('codes_'):]
+            fields[field] = (npz[key], npz['labels_' + field])
+    return index, fields
+
+
+def count_bits(index, bits):
+    '''number of base rows set in bit packed mask
+    '''
+    count = int(popcount_table[bits].sum(dtype='int64'))
+    # bits past the last row are set by negated terms
+    tail = len(bits) * 8 - index['size']
+    if tail:
+        count -= int(popcount_table[bits[-1] & ((1 << tail) - 1)])
+    return count
+
+
+def distribution(field, mask):
+    '''counts of field values over rows in mask
+    '''
+    if isinstance(field, tuple):
+        codes, labels = field
+        counts = np.bincount(codes[mask], minlength=len(labels))
+        return OrderedDict((text_type(l), int(c))
+                           for l, c in zip(labels, counts) if c)
+    values, counts = np.unique(field[mask], return_counts=True)
+    return OrderedDict((str(v), int(c)) for v, c in zip(values, counts))
+
+
+def query_case(index, fields, case):
+    '''counts and distributions of case from bitmap index
+    '''
+    f = eval_terms(index, case.get('filters', []))
+    c = eval_terms(index, case['control']) & f
+    # rows matching both treatment and control are controls
+    t = eval_terms(index, case['treatment']) & f & ~c
+
+    stats = OrderedDict()
+    stats['treatment_count'] = count_bits(index, t)
+    stats['control_count'] = count_bits(index, c)
+    stats['total_count'] = stats['treatment_count'] + stats['control_count']
+
+    for group, bits in [('treatment', t), ('control', c)]:
+        if not stats[group + '_count']:
+            continue
+        mask = unpack_mask(index, bits)
+        if 'gef_id' in fields:
+            stats[group + '_projects'] = len(np.unique(fields['gef_id'][mask]))
+        for field in ['type', 'transactions_start_year']:
+            if field in fields:
+                stats['{0}_by_{1}'.format(group, field)] = distribution(
+                    fields[field], mask)
+    return stats
+
+
+if __name__ == '__main__':
+
+    from case_definitions import case_definitions
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cases', nargs='*',
+                        help='names of declared cases to count')
+    parser.add_argument('--all', action='store_true',
+                        help='count every declared case')
+    parser.add_argument('-t', '--treatment', nargs='+', default=None,
+                        help='treatment terms of candidate case')
+    parser.add_argument('-c', '--control', nargs='+', default=['rand'],
+                        help='control terms of candidate case')
+    parser.add_argument('-f', '--filters', nargs='*', default=[],
+                        help='filter terms of candidate case')
+    parser.add_argument('--terms', action='store_true',
+                        help='list terms available in index')
+    parser.add_argument('--counts-only', action='store_true',
+                        help='only print treatment/control/total counts')
+    parser.add_argument('--index', default="{0}/data_prep/analysis_cases/case_index.npz".format(repo_dir),
+                        help='case index saved by build_analysis_cases.py')
+    args = parser.parse_args()
+
+    case_index, case_fields = load_case_index(args.index)
+
+    if args.terms:
+        print '\n'.join(case_index['names'])
+
+    declared = OrderedDict((c['name'], c) for c in case_definitions)
+    if args.all:
+        cases = list(declared.values())
+    else:
+        unknown = [name for name in args.cases if name not in declared]
+        if unknown:
+            parser.error("Unknown cases: {0}".format(', '.join(unknown)))
+        cases = [declared[name] for name in args.cases]
+    if args.treatment:
+        cases.append({'name': 'query',
+                      'treatment': args.treatment,
+                      'control': args.control,
+                      'filters': args.filters})
+
+    for case in cases:
+        case_stats = query_case(case_index, case_fields, case)
+        if args.counts_only:
+            case_stats = OrderedDict((k, case_stats[k]) for k in
+                                     ['treatment_count', 'control_count', 'total_count'])
+        print "{0}: {1}".format(case['name'], json.dumps(case_stats, indent=4))
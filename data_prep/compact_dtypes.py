@@ -0,0 +1,171 @@
+"""
+compact dtype plan for the wide merged / base data tables
+
+columns are matched (by name or glob pattern) against `compact_schema`:
+
+    category    low cardinality strings (type, round, ...) are stored as
+                categoricals (integer codes + one copy of each string)
+    id          integral ids without missing values are downcast to the
+                smallest integer type, low cardinality string ids become
+                categoricals
+    float32     covariates are stored as float32 when every value round
+                trips within `float32_tolerance` (absolute)
+
+columns which do not qualify are left as loaded. the memory usage of every
+changed column before/after is reported.
+
+float32 values are rounded, so frames written to outputs (base data,
+cases) are only compacted where the callers opt in (`compact_load`).
+"""
+
+from fnmatch import fnmatch
+
+import numpy as np
+import pandas as pd
+
+
+compact_schema = {
+    'category': [
+        'type', 'round', 'location_type_code', 'GEF replenishment phase',
+        'Focal Area', 'Type acronym', 'GEF phase', 'start_year_source',
+        'Country', 'Region', 'Agency', 'Lead agency', 'Status'
+    ],
+    'id': [
+        'gef_id', 'id', 'project_location_id', 'project_id', 'GEF_ID',
+        'GEF ID'
+    ],
+    'float32': [
+        'ltdr_yearly_ndvi_*', 'udel_*', 'gpw_*', 'v4composites_*',
+        'lossyr25.*', 'lossyear.*', 'dist_to_*', 'srtm_*',
+        'accessibility_map.*', 'treecover*', '00forest25.*', 'wdpa_5km.*'
+    ]
+}
+
+# max absolute error of float64 -> float32 round trip (float32 keeps
+# about 7 significant digits, so covariates with large values or many
+# decimals are rejected)
+float32_tolerance = 1e-6
+
+# max unique values (as fraction of rows) for categoricals
+max_category_ratio = 0.5
+
+
+def match_columns(columns, patterns):
+    '''columns matching any name/glob pattern (in column order)
+    '''
+    return [c for c in columns if any(fnmatch(str(c), p) for p in patterns)]
+
+
+def is_string_column(series):
+    '''check if series holds strings (object or pandas string dtype)
+    '''
+    return series.dtype == object or str(series.dtype) in ['string', 'str']
+
+
+def category_dtype(series):
+    '''category if series is low cardinality string column
+    '''
+    if not is_string_column(series) or not len(series):
+        return None
+    if series.nunique() > max_category_ratio * len(series):
+        return None
+    return 'category'
+
+
+def id_dtype(series):
+    '''smallest integer type for integral ids, category for string ids
+    '''
+    if is_string_column(series):
+        return category_dtype(series)
+    if series.dtype.kind not in 'iuf' or not len(series):
+        return None
+    values = series.values
+    if series.dtype.kind == 'f' and (np.isnan(values).any()
+                                     or (values != np.floor(values)).any()):
+        # missing / non integral ids stay as loaded
+        return None
+    for dtype in ['int8', 'int16', 'int32', 'int64']:
+        info = np.iinfo(dtype)
+        if values.min() >= info.min and values.max() <= info.max:
+            break
+    return None if np.dtype(dtype) == series.dtype else dtype
+
+
+def float32_dtype(series, tolerance=float32_tolerance):
+    '''float32 if every value survives the round trip within (absolute)
+    tolerance
+    '''
+    if series.dtype != 'float64':
+        return None
+    values = series.values
+    with np.errstate(invalid='ignore', over='ignore'):
+        err = np.abs(values.astype('float32').astype('float64') - values)
+    # nan stays nan, inf / overflow (inf - inf or inf error) is rejected
+    err = err[~(np.isnan(values) & np.isnan(err))]
+    if len(err) and not (err <= tolerance).all():
+        return None
+    return 'float32'
+
+
+def dtype_plan(df, schema=compact_schema, tolerance=float32_tolerance):
+    '''target dtype of every column of df which can be made more compact
+    '''
+    plan = {}
+    for c in match_columns(df.columns, schema.get('category', [])):
+        plan[c] = category_dtype(df[c])
+    for c in match_columns(df.columns, schema.get('id', [])):
+        plan[c] = id_dtype(df[c])
+    for c in match_columns(df.columns, schema.get('float32', [])):
+        plan[c] = float32_dtype(df[c], tolerance=tolerance)
+    return dict((c, t) for c, t in plan.items() if t is not None)
+
+
+def apply_dtype_plan(df, plan):
+    '''copy of df with columns converted to the planned dtypes
+    '''
+    if not plan:
+        return df
+    # astype leaves one block per converted column, copy consolidates
+    # them so later column inserts stay cheap
+    return df.astype(plan).copy()
+
+
+def memory_report(df, plan, before):
+    '''memory used by each planned column before/after conversion
+
+    before is the (deep) memory_usage of df prior to conversion
+    '''
+    after = df[list(plan.keys())].memory_usage(index=False, deep=True)
+    report_df = pd.DataFrame({
+        'column': list(plan.keys()),
+        'dtype': [plan[c] for c in plan],
+        'bytes_before': [int(before[c]) for c in plan],
+        'bytes_after': [int(after[c]) for c in plan]
+    }, columns=['column', 'dtype', 'bytes_before', 'bytes_after'])
+    report_df['bytes_saved'] = report_df['bytes_before'] - report_df['bytes_after']
+    return report_df.sort_values(by='bytes_saved', ascending=False).reset_index(drop=True)
+
+
+def compact_frame(df, schema=compact_schema, tolerance=float32_tolerance):
+    '''apply compact dtype plan to df
+
+    returns (df, report_df) where report_df has the memory saved per
+    converted column
+    '''
+    plan = dtype_plan(df, schema=schema, tolerance=tolerance)
+    before = df[list(plan.keys())].memory_usage(index=False, deep=True)
+    df = apply_dtype_plan(df, plan)
+    return df, memory_report(df, plan, before)
+
+
+def report_summary(report_df, top=10):
+    '''printable summary lines of memory report
+    '''
+    mb = 1024.0 ** 2
+    lines = ["Compact dtypes: {0} columns, {1:.1f} MB -> {2:.1f} MB".format(
+        len(report_df), report_df['bytes_before'].sum() / mb,
+        report_df['bytes_after'].sum() / mb)]
+    for _, r in report_df.head(top).iterrows():
+        lines.append("    {0:<40} {1:<10} {2:>9.2f} MB saved".format(
+            r['column'], r['dtype'], r['bytes_saved'] / mb))
+    return lines
@@ -0,0 +1,104 @@
+"""
+focal area component tags of gef projects
+
+ancillary sheets are scanned in vectorized form and reduced to a long
+table with one row per (gef_id, tag):
+
+    cell sheets     every non empty cell (e.g. "BD", "LD", "CCM") of the
+                    CD/MFA project sheets is a tag of the row's gef id
+    keyword sheets  free text field (e.g. "Sub-Foci") is scanned once with
+                    a single compiled regex over the keywords of all tags
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from gef_id_registry import parse_ids, invalid_key
+
+
+# text values of sheets (str / unicode, values are never cast to str so
+# non ascii text works under python 2)
+text_types = (type(u''), type(''))
+
+
+# keywords (substring match) identifying each tag in free text fields
+component_keywords = {
+    'LD': ["LD", "Sustainable", "SFM", "REDD", "LULUCF",
+           "Land", "Degradation", "Degredation"],
+    'BD': ["BD", "Biodiversity"]
+}
+
+
+def is_text(values):
+    '''boolean mask of values which are non empty text
+    '''
+    return np.array([isinstance(v, text_types) and len(v) > 0
+                     for v in values], dtype='bool')
+
+
+def cell_tags(sheet_df, id_field):
+    '''(gef_id, tag) for every non empty cell of sheet
+    '''
+    values_df = sheet_df.drop(id_field, axis=1)
+    values_df.index = parse_ids(sheet_df[id_field], source=id_field)
+    values_df.columns = range(values_df.shape[1])
+
+    cells = values_df.stack().dropna()
+    cells = cells.loc[is_text(cells.values)]
+
+    tags_df = pd.DataFrame({
+        'gef_id': cells.index.get_level_values(0),
+        'tag': cells.values
+    }, columns=['gef_id', 'tag'])
+
+    return tags_df.loc[tags_df['gef_id'] != invalid_key]
+
+
+def keyword_pattern(keywords):
+    '''single regex matching any keyword of any tag
+
+    longest keywords first so overlapping keywords resolve to the
+    longer match
+    '''
+    words = sorted(set(w for k in keywords.values() for w in k),
+                   key=lambda w: (-len(w), w))
+    return re.compile('(' + '|'.join(re.escape(w) for w in words) + ')')
+
+
+def keyword_tags(sheet_df, id_field, text_field, keywords=component_keywords):
+    '''(gef_id, tag) for every tag with a keyword found in text field
+    '''
+    word_tag = dict((w, tag) for tag, words in keywords.items() for w in words)
+
+    text = pd.Series(sheet_df[text_field].values, dtype='object')
+    text = text.loc[is_text(text.values)]
+    matches = text.str.extractall(keyword_pattern(keywords))[0]
+
+    ids = parse_ids(sheet_df[id_field], source=id_field)
+    tags_df = pd.DataFrame({
+        'gef_id': ids[matches.index.get_level_values(0)],
+        'tag': matches.map(word_tag).values
+    }, columns=['gef_id', 'tag'])
+
+    return tags_df.loc[tags_df['gef_id'] != invalid_key]
+
+
+def component_tags(cell_sheets, keyword_sheets, keywords=component_keywords):
+    '''long table of unique (gef_id, tag) over all sheets
+
+    cell_sheets is a list of (sheet_df, id_field) and keyword_sheets a
+    list of (sheet_df, id_field, text_field)
+    '''
+    tags = [cell_tags(df, id_field) for df, id_field in cell_sheets]
+    tags += [keyword_tags(df, id_field, text_field, keywords=keywords)
+             for df, id_field, text_field in keyword_sheets]
+    tags_df = pd.concat(tags, ignore_index=True)
+    return tags_df.drop_duplicates().reset_index(drop=True)
+
+
+def tag_ids(tags_df, tag):
+    '''sorted unique gef id keys with tag
+    '''
+    return np.unique(tags_df.loc[tags_df['tag'] == tag, 'gef_id'].values)
@@ -0,0 +1,146 @@
+"""
+indexed lookups of enrichment tables
+
+data rows are enriched from lookup tables (location ids, project round,
+locations, projects, gef project info, ...) without a full merge per
+table. each lookup table is indexed once on its key field:
+
+    build_lookup    hashed dictionary of the distinct keys of the table
+                    (key -> integer code) and the table rows grouped by
+                    code (row offset and row count of every code)
+    lookup_codes    integer code of every data row key (-1 for keys not
+                    in the table, missing keys never match)
+    enrich          table fields gathered for every data row by code and
+                    added to the data frame, giving the same rows and
+                    fields as data_df.merge(table, on=key, how=how)
+
+data rows are only copied when the result has a different number of rows
+than the data: keys matching more than one lookup row (one to many) or,
+for inner lookups, rows without a match. one to many keys are found from
+the row counts before any row is expanded and are recorded (source name,
+key, lookup rows, data rows, added rows) in `fanout_keys`.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# (source, key, lookup rows, data rows, added rows) of every one to
+# many key found by enrich
+fanout_keys = []
+
+
+def build_lookup(table_df, key):
+    '''index of lookup table on key field
+
+    rows with a missing key are not indexed
+    '''
+    table = table_df.reset_index(drop=True)
+    codes, uniques = pd.factorize(table[key])
+    codes = np.asarray(codes, dtype='int64')
+
+    # table rows grouped by code (table order kept within a code)
+    indexed = np.where(codes >= 0)[0]
+    order = indexed[np.argsort(codes[indexed], kind='mergesort')]
+    counts = np.bincount(codes[indexed], minlength=len(uniques))
+    offsets = np.zeros(len(uniques), dtype='int64')
+    offsets[1:] = np.cumsum(counts)[:-1]
+
+    return {
+        'key': key,
+        'table': table,
+        'keys': pd.Index(uniques),
+        'rows': order,
+        'offsets': offsets,
+        'counts': counts
+    }
+
+
+def lookup_codes(lookup, values):
+    '''code of every key in lookup table (-1 where key has no match)
+    '''
+    if not len(lookup['keys']):
+        return np.full(len(values), -1, dtype='int64')
+    return np.asarray(lookup['keys'].get_indexer(values), dtype='int64')
+
+
+def key_fanout(lookup, codes):
+    '''number of lookup rows matching each data row
+    '''
+    fanout = np.zeros(len(codes), dtype='int64')
+    matched = codes >= 0
+    fanout[matched] = lookup['counts'][codes[matched]]
+    return fanout
+
+
+def fanout_report():
+    '''table of recorded one to many keys
+    '''
+    return pd.DataFrame(fanout_keys, columns=['source', 'key', 'lookup_rows',
+                                              'data_rows', 'added_rows'])
+
+
+def record_fanout(lookup, codes, fanout, source):
+    '''record keys matching more than one lookup row, returns number of
+    rows they add
+    '''
+    multi = fanout > 1
+    if not multi.any():
+        return 0
+    multi_codes, data_rows = np.unique(codes[multi], return_counts=True)
+    for code, n in zip(multi_codes, data_rows):
+        lookup_rows = int(lookup['counts'][code])
+        fanout_keys.append((source, lookup['keys'][code], lookup_rows,
+                            int(n), int(n) * (lookup_rows - 1)))
+    return int((fanout[multi] - 1).sum())
+
+
+def enrich(data_df, lookup, how='left', source=None,
+           suffixes=('_x', '_y')):
+    '''add fields of lookup table to data rows
+
+    same rows and fields as a merge of data_df with the lookup table on
+    its key, rows follow the order of the data keys (lookup rows of a key
+    in table order). one to many keys are recorded in fanout_keys
+    (when a source name is given) before rows are expanded
+    '''
+    if how not in ('left', 'inner'):
+        raise ValueError("Unsupported lookup join: {0}".format(how))
+
+    key = lookup['key']
+    table = lookup['table']
+    codes = lookup_codes(lookup, data_df[key].values)
+    fanout = key_fanout(lookup, codes)
+    if source is not None:
+        record_fanout(lookup, codes, fanout, source)
+
+    # output rows of every data row
+    reps = np.maximum(fanout, 1) if how == 'left' else fanout
+    data_rows = np.repeat(np.arange(len(data_df)), reps)
+
+    # lookup row of every output row (-1 for no match)
+    rank = np.arange(len(data_rows)) - np.repeat(np.cumsum(reps) - reps, reps)
+    out_codes = codes[data_rows]
+    table_rows = np.full(len(data_rows), -1, dtype='int64')
+    matched = out_codes >= 0
+    table_rows[matched] = lookup['rows'][
+        lookup['offsets'][out_codes[matched]] + rank[matched]]
+
+    if len(data_rows) == len(data_df) and (reps == 1).all():
+        # one row per data row, data rows are not gathered
+        out = data_df.copy(deep=False)
+    else:
+        out = data_df.iloc[data_rows]
+    out.index = pd.RangeIndex(len(out))
+
+    fields = [c for c in table.columns if c != key]
+    overlap = set(fields) & set(out.columns)
+    if overlap:
+        out = out.rename(columns=dict(
+            (c, c + suffixes[0]) for c in overlap))
+
+    # missing rows (-1) become nan, with the same dtype changes as a merge
+    gathered = table[fields].reindex(table_rows)
+    gathered.columns = [c + suffixes[1] if c in overlap else c for c in fields]
+    gathered.index = out.index
+    return pd.concat([out, gathered], axis=1)
@@ -0,0 +1,129 @@
+"""
+gef id registry
+
+gef ids come in as ints, floats (columns with missing values), strings or
+a mix of these depending on the sheet. every id field is parsed once, in
+vectorized form, to an int64 key:
+
+    parse_ids       int64 keys of an id field, rows which do not parse to
+                    an integral id get `invalid_key` and are recorded
+                    (source name, row position and raw value) in
+                    `parse_failures`
+    id_set          sorted unique int64 array of the valid keys of a field
+    id_text         ids as integer text for outputs
+
+id sets (valid mfa / ld / bio projects, not geocoded projects, programmatic
+projects, ...) are combined with sorted array set operations (union /
+intersection / difference) and rows are matched against a set with a
+hashed membership test, so no step scans python lists.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# key of ids which do not parse
+invalid_key = -999
+
+# (source, row, raw value) of every id which did not parse
+parse_failures = []
+
+
+def parse_ids(values, source=None):
+    '''int64 keys of gef ids (invalid_key where id does not parse)
+
+    failed rows (missing values excluded) are recorded in parse_failures
+    when a source name is given
+    '''
+    # plain array (categorical columns become their values)
+    if hasattr(values, 'dtype'):
+        raw = pd.Series(np.asarray(values))
+    else:
+        raw = pd.Series(np.asarray(values, dtype='object'))
+    if raw.dtype.kind in 'iu':
+        return raw.values.astype('int64')
+
+    num = pd.to_numeric(raw, errors='coerce').values.astype('float64')
+    valid = ~np.isnan(num)
+    valid[valid] = num[valid] == np.floor(num[valid])
+
+    keys = np.full(len(raw), invalid_key, dtype='int64')
+    keys[valid] = num[valid].astype('int64')
+
+    if source is not None:
+        failed = np.where(~valid & raw.notnull().values)[0]
+        parse_failures.extend(
+            (source, int(i), raw.iloc[i]) for i in failed)
+
+    return keys
+
+
+def id_text(values):
+    '''gef ids as written to outputs
+
+    integer text where the id parses to a key (no float formatting of ids
+    read from columns with missing values), the value as is otherwise
+    '''
+    raw = np.asarray(values, dtype='object')
+    keys = parse_ids(raw)
+    valid = keys != invalid_key
+    out = raw.copy()
+    out[valid] = [str(k) for k in keys[valid]]
+    return out
+
+
+def failure_report():
+    '''table of recorded parse failures
+    '''
+    return pd.DataFrame(parse_failures, columns=['source', 'row', 'value'])
+
+
+def id_set(values, source=None):
+    '''sorted unique array of valid keys of gef ids
+    '''
+    keys = parse_ids(values, source=source)
+    return np.unique(keys[keys != invalid_key])
+
+
+def union(*sets):
+    '''sorted unique keys in any of sets
+    '''
+    if not sets:
+        return np.array([], dtype='int64')
+    return np.unique(np.concatenate(sets).astype('int64'))
+
+
+def intersection(a, b):
+    '''sorted unique keys in both a and b
+    '''
+    return np.intersect1d(a, b)
+
+
+def difference(a, b):
+    '''sorted unique keys of a which are not in b
+    '''
+    return np.setdiff1d(a, b)
+
+
+def in_set(keys, ids):
+    '''boolean array of keys found in id set (hashed lookup)
+    '''
+    return pd.Series(np.asarray(keys, dtype='int64')).isin(
+        np.asarray(ids, dtype='int64')).values
+
+
+def group_counts(groups, weights=None, mask=None):
+    '''count (or sum of weights) of rows per group value
+
+    returns dict of group value to count over rows in mask
+    '''
+    groups = np.asarray(groups, dtype='object')
+    if mask is not None:
+        groups = groups[mask]
+        weights = None if weights is None else np.asarray(weights)[mask]
+    codes, uniques = pd.factorize(groups)
+    keep = codes >= 0
+    counts = np.bincount(codes[keep], minlength=len(uniques),
+                         weights=None if weights is None
+                         else np.asarray(weights)[keep])
+    return dict((u, int(c)) for u, c in zip(uniques, counts))
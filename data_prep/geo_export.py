@@ -0,0 +1,136 @@
+"""
+point feature exports of lon/lat frames
+
+point features are written straight from the lon/lat columns of a frame
+without building a geometry per row:
+
+    geojson     streamed feature by feature (a chunk of rows is converted
+                at a time), so the collection is never held in memory as
+                a GeoDataFrame, a json string or a parsed dict
+    parquet     GeoParquet (geopandas), points built at once from the
+                lon/lat arrays
+    fgb         FlatGeobuf (geopandas / fiona), same as parquet (features
+                are stored in the order of the packed spatial index)
+
+geojson output has the same layout as a GeoDataFrame.to_json() dump with
+indent=4 (feature id is the frame index label, nan properties are null).
+"""
+
+import os
+import json
+from collections import OrderedDict
+
+import numpy as np
+import geopandas as gpd
+
+
+# rows converted to features at a time when streaming geojson
+geojson_chunk_size = 10000
+
+# file extension of each export format
+export_extensions = {
+    'geojson': 'geojson',
+    'parquet': 'parquet',
+    'fgb': 'fgb'
+}
+
+
+def column_values(series):
+    '''python values of frame column with nan / missing as None
+    '''
+    values = series.astype('object').where(series.notnull(), None)
+    return values.tolist()
+
+
+def point_features(df, lon_field='longitude', lat_field='latitude',
+                   chunk_size=geojson_chunk_size):
+    '''geojson point feature of every row (generator)
+
+    all fields of df are feature properties
+    '''
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        ids = [str(i) for i in chunk.index]
+        lon = chunk[lon_field].values.astype('float64').tolist()
+        lat = chunk[lat_field].values.astype('float64').tolist()
+        fields = [str(c) for c in chunk.columns]
+        values = [column_values(chunk.iloc[:, i]) for i in range(chunk.shape[1])]
+        for row in range(len(chunk)):
+            feature = OrderedDict()
+            feature['id'] = ids[row]
+            feature['type'] = 'Feature'
+            feature['properties'] = OrderedDict(
+                (f, v[row]) for f, v in zip(fields, values))
+            feature['geometry'] = OrderedDict([
+                ('type', 'Point'),
+                ('coordinates', [lon[row], lat[row]])
+            ])
+            yield feature
+
+
+def write_geojson(df, path, lon_field='longitude', lat_field='latitude',
+                  chunk_size=geojson_chunk_size):
+    '''stream frame to geojson feature collection of points
+
+    written to a temporary file first, so an interrupted write does not
+    leave a truncated collection behind
+    '''
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('{\n    "type": "FeatureCollection",\n    "features": [')
+        first = True
+        for feature in point_features(df, lon_field, lat_field, chunk_size):
+            text = json.dumps(feature, indent=4).replace('\n', '\n        ')
+            f.write(('\n        ' if first else ',\n        ') + text)
+            first = False
+        f.write(']\n}' if first else '\n    ]\n}')
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def typed_frame(df):
+    '''frame with mixed type object columns as strings
+
+    columnar formats need a single type per field (eg. wdpa ids read as
+    numbers from one sheet and as text from another)
+    '''
+    out = df.copy()
+    for c in out.columns:
+        if out[c].dtype != 'object':
+            continue
+        present = out[c].notnull()
+        if len(set(type(v) for v in out.loc[present, c])) > 1:
+            out[c] = out[c].astype('str').where(present, None)
+    return out
+
+
+def point_frame(df, lon_field='longitude', lat_field='latitude'):
+    '''GeoDataFrame of frame with point geometry built from lon/lat arrays
+    '''
+    df = typed_frame(df)
+    geometry = gpd.points_from_xy(np.asarray(df[lon_field], dtype='float64'),
+                                  np.asarray(df[lat_field], dtype='float64'))
+    return gpd.GeoDataFrame(df, geometry=geometry, crs='EPSG:4326')
+
+
+def write_points(df, path, export='geojson', lon_field='longitude',
+                 lat_field='latitude'):
+    '''write frame as point features in given export format
+    '''
+    if export == 'geojson':
+        write_geojson(df, path, lon_field, lat_field)
+    elif export == 'parquet':
+        point_frame(df, lon_field, lat_field).to_parquet(path, index=False)
+    elif export == 'fgb':
+        if os.path.exists(path):
+            os.remove(path)
+        point_frame(df, lon_field, lat_field).to_file(path, driver='FlatGeobuf')
+    else:
+        raise ValueError("Unknown point export format: {0}".format(export))
+
+
+def export_path(base_path, export):
+    '''path of export (base path without extension)
+    '''
+    return '{0}.{1}'.format(base_path, export_extensions[export])
@@ -0,0 +1,128 @@
+"""
+spatial index over iba monitoring sites
+
+a ball tree (haversine metric) is built once over the deduplicated iba sites
+and then used to answer nearest site lookups for every merged row in a single
+batched query. distances are returned in kilometres.
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+
+# mean earth radius (km)
+earth_radius = 6371.0088
+
+
+def to_radians(lon, lat):
+    '''convert longitude/latitude arrays to (lat, lon) radians
+    as expected by haversine ball tree
+    '''
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    return np.radians(np.column_stack([lat, lon]))
+
+
+def valid_coords(lon, lat):
+    '''boolean mask of rows with usable coordinates
+    '''
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    return np.isfinite(lon) & np.isfinite(lat)
+
+
+def build_iba_tree(iba_df):
+    '''build ball tree from iba site Longitude/Latitude fields
+
+    iba_df should already be deduplicated to one row per site
+    '''
+    coords = to_radians(iba_df['Longitude'], iba_df['Latitude'])
+    return BallTree(coords, metric='haversine')
+
+
+def nearest_iba(tree, iba_df, lon, lat):
+    '''find nearest iba site for each lon/lat pair
+
+    returns dataframe (one row per input point, in input order) with
+    iba_statescore, iba_distance (km), iba_area and iba_year. site fields
+    keep the integer dtype of the iba source columns. points without valid
+    coordinates keep -1 for all fields
+    '''
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    n = len(lon)
+
+    def sentinel(field):
+        kind = iba_df[field].dtype.kind
+        return np.full(n, -1, dtype='int64' if kind in 'iu' else 'float64')
+
+    out = pd.DataFrame({
+        'iba_statescore': sentinel('StateScore'),
+        'iba_distance': np.full(n, -1, dtype='float64'),
+        'iba_area': sentinel('Area'),
+        'iba_year': sentinel('MonitoringYear')
+    }, columns=['iba_statescore', 'iba_distance', 'iba_area', 'iba_year'])
+
+    valid = valid_coords(lon, lat)
+    if not valid.any():
+        return out
+
+    dist, ix = tree.query(to_radians(lon[valid], lat[valid]), k=1)
+    ix = ix[:, 0]
+
+    out.loc[valid, 'iba_distance'] = dist[:, 0] * earth_radius
+    out.loc[valid, 'iba_statescore'] = iba_df['StateScore'].values[ix]
+    out.loc[valid, 'iba_area'] = iba_df['Area'].values[ix]
+    out.loc[valid, 'iba_year'] = iba_df['MonitoringYear'].values[ix]
+
+    return out
+
+
+def iba_radius_features(tree, iba_df, lon, lat, radii):
+    '''count, total Area and mean StateScore of iba sites within each
+    radius (km) of each lon/lat pair
+
+    a single radius query is run at the largest radius and the results
+    are binned for the smaller radii. returns dataframe with
+    iba_count_{r}km, iba_area_{r}km and iba_statescore_{r}km fields
+    (mean statescore is nan where no sites are within radius)
+    '''
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    n = len(lon)
+    radii = sorted(radii)
+
+    valid = valid_coords(lon, lat)
+    valid_ix = np.where(valid)[0]
+
+    if len(valid_ix) > 0:
+        ind, dist = tree.query_radius(to_radians(lon[valid], lat[valid]),
+                                      r=max(radii) / earth_radius,
+                                      return_distance=True)
+        counts = np.array([len(i) for i in ind])
+        site_ix = np.concatenate(ind).astype('int64')
+        site_dist = np.concatenate(dist) * earth_radius
+        row_ix = np.repeat(valid_ix, counts)
+    else:
+        site_ix = np.array([], dtype='int64')
+        site_dist = np.array([], dtype='float64')
+        row_ix = np.array([], dtype='int64')
+
+    area = iba_df['Area'].values.astype('float64')[site_ix]
+    score = iba_df['StateScore'].values.astype('float64')[site_ix]
+
+    out = pd.DataFrame(index=range(n))
+    for r in radii:
+        within = site_dist <= r
+        r_rows = row_ix[within]
+        count = np.bincount(r_rows, minlength=n)
+        area_sum = np.bincount(r_rows, weights=area[within], minlength=n)
+        score_sum = np.bincount(r_rows, weights=score[within], minlength=n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            score_mean = score_sum / count
+        out['iba_count_{0}km'.format(r)] = count
+        out['iba_area_{0}km'.format(r)] = area_sum
+        out['iba_statescore_{0}km'.format(r)] = score_mean
+
+    return out
@@ -0,0 +1,82 @@
+"""
+point geometry derived from lon/lat arrays on demand
+
+merged locations and base data keep their coordinates as the float
+longitude / latitude fields only. point geometries (shapely arrays with
+shapely >= 2.0, lists of Point objects before) are created when a spatial
+operation asks for them, and the wkt `geometry` text field of the csv
+outputs is rebuilt from the coordinates of the rows being written instead
+of being carried through every stage.
+
+wkt text is the same as the str() of the point (what a GeoDataFrame
+geometry column used to write to csv).
+"""
+
+import numpy as np
+import shapely
+from shapely.geometry import Point
+
+
+# shapely >= 2.0 builds / formats arrays of geometries at once
+vectorized = hasattr(shapely, 'points')
+
+# wkt text field of csv outputs
+geometry_field = 'geometry'
+
+# rows formatted as wkt at a time
+wkt_chunk_size = 100000
+
+
+def point_geoms(lon, lat):
+    '''array of points
+    '''
+    if vectorized:
+        return shapely.points(lon, lat)
+    out = np.empty(len(lon), dtype='object')
+    out[:] = [Point(x, y) for x, y in zip(lon, lat)]
+    return out
+
+
+def point_wkt(lon, lat):
+    '''array of point wkt text of lon/lat arrays
+    '''
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    out = np.empty(len(lon), dtype='object')
+    for start in range(0, len(lon), wkt_chunk_size):
+        end = start + wkt_chunk_size
+        if vectorized:
+            # geometries only live for one chunk
+            out[start:end] = shapely.to_wkt(
+                shapely.points(lon[start:end], lat[start:end]),
+                rounding_precision=-1)
+        else:
+            out[start:end] = [Point(x, y).wkt
+                              for x, y in zip(lon[start:end], lat[start:end])]
+    return out
+
+
+def drop_geometry(df):
+    '''frame without geometry text field
+
+    returns (frame, position of geometry field) where position is None
+    if frame had no geometry field
+    '''
+    if geometry_field not in df.columns:
+        return df, None
+    loc = list(df.columns).index(geometry_field)
+    return df.drop(geometry_field, axis=1), loc
+
+
+def with_geometry(df, loc=None, lon_field='longitude', lat_field='latitude'):
+    '''copy of frame with geometry text field built from lon/lat fields
+
+    field is inserted at position loc (appended if loc is None)
+    '''
+    # shallow copy, base fields are not duplicated
+    out = df.copy(deep=False)
+    if loc is None:
+        loc = out.shape[1]
+    out.insert(min(loc, out.shape[1]), geometry_field,
+               point_wkt(out[lon_field].values, out[lat_field].values))
+    return out
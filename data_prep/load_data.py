@@ -0,0 +1,436 @@
+"""
+shared csv loader
+
+csvs are parsed with the multithreaded pyarrow csv reader and a typed
+columnar (feather) copy is cached next to each source file. the cache is
+keyed by the size/mtime of the source, with a sha1 hash of its contents used
+to decide whether a changed size/mtime really means changed data. repeated
+runs therefore skip text parsing entirely. cache and key are written to
+temporary files and renamed into place (cache first), so processes reading
+the same source at once never see a partial cache. sources which cannot be
+stored as feather (mixed type columns) get a key without a cache and are
+parsed without being hashed again.
+
+parsing keeps the semantics of the original pandas reader used throughout
+the repo (`na_values=''`, `keep_default_na=False`, pandas column naming).
+
+consumers which only need part of a table can pass the columns and row
+filters they need, e.g.
+
+    read_csv(path, columns=['gef_id', 'type', 'iba_area'],
+             filters=[('type', '!=', 'rand')])
+
+only those columns (plus any filter columns) are read from the feather
+cache and rows are filtered before conversion to pandas. a missing or stale
+cache is rebuilt from one full parse first, so later reads of any columns
+skip text parsing. without a cache (cache=False) the csv is streamed and
+filtered batch by batch instead. filters are (column, op, value) with op
+one of ==, !=, <, <=, >, >=, in, not in. missing values compare as in
+pandas (they only match != and not in).
+
+parsing, filtering and streaming in arrow need the quoted null csv option,
+compute kernels, Table.filter and the streaming csv reader (pyarrow >=
+0.17). with older pyarrow (0.16 is the last release for python 2.7) csvs
+are parsed and rows are filtered in pandas instead.
+"""
+
+import os
+import json
+import hashlib
+import operator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
+from pyarrow import feather as pa_feather
+
+try:
+    import pyarrow.compute as pc
+except ImportError:
+    pc = None
+
+# compute kernels used for row filters (older pyarrow has a
+# pyarrow.compute module without them)
+arrow_kernels = ['equal', 'not_equal', 'less', 'less_equal', 'greater',
+                 'greater_equal', 'is_in', 'invert', 'fill_null', 'and_']
+if pc is not None and not all(hasattr(pc, k) for k in arrow_kernels):
+    pc = None
+
+# rows of arrow tables / record batches can be filtered in arrow
+arrow_filters = (pc is not None and hasattr(pa.Table, 'filter')
+                 and hasattr(pa.RecordBatch, 'filter'))
+
+# arrow csv reader can treat quoted empty fields as missing (pyarrow >= 0.17).
+# before that a quoted "" is an empty string, so numeric columns of fully
+# quoted csvs are inferred as text and the pandas reader is used instead
+try:
+    pa_csv.ConvertOptions(quoted_strings_can_be_null=True)
+    arrow_csv = True
+except TypeError:
+    arrow_csv = False
+
+# csv can be read batch by batch
+arrow_stream = arrow_csv and hasattr(pa_csv, 'open_csv')
+
+
+# rows parsed per block when streaming csv (larger blocks also give
+# more rows for type inference)
+stream_block_size = 1 << 24
+
+# rows per chunk for the pandas streaming fallback
+stream_chunk_rows = 100000
+
+filter_ops = {
+    '==': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le,
+    '>': operator.gt, '>=': operator.ge
+}
+
+if pc is not None:
+    arrow_ops = {
+        '==': pc.equal, '!=': pc.not_equal,
+        '<': pc.less, '<=': pc.less_equal,
+        '>': pc.greater, '>=': pc.greater_equal
+    }
+
+
+def file_stat(paths):
+    '''size and mtime of each file
+    '''
+    stat = {}
+    for path in paths:
+        st = os.stat(path)
+        stat[os.path.basename(path)] = [st.st_size, st.st_mtime]
+    return stat
+
+
+def file_hash(paths, block_size=2**20):
+    '''sha1 hash of file contents
+    '''
+    sha = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def temp_path(path):
+    '''temporary path next to path (unique per process)
+    '''
+    return '{0}.{1}.tmp'.format(path, os.getpid())
+
+
+def replace_file(tmp_path, path):
+    '''move finished temporary file over path
+
+    atomic on posix, readers see either the old or the new file
+    '''
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # windows does not rename over an existing file
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+def read_meta(cache_path):
+    '''cache key stored alongside cache file (None if no valid cache)
+
+    a key with feather false records a source which cannot be cached
+    '''
+    meta_path = cache_path + '.json'
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    if meta.get('feather', True) and not os.path.isfile(cache_path):
+        return None
+    return meta
+
+
+def write_meta(cache_path, meta):
+    '''save cache key alongside cache file
+    '''
+    meta_path = cache_path + '.json'
+    tmp_path = temp_path(meta_path)
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f, indent=4)
+    replace_file(tmp_path, meta_path)
+
+
+def write_cache(df, cache_path):
+    '''write frame as feather cache, returns False if it cannot be stored
+
+    written to a temporary file first, so concurrent readers / writers
+    never see a partial cache
+    '''
+    tmp_path = temp_path(cache_path)
+    try:
+        df.to_feather(tmp_path)
+    except (pa.ArrowException, ValueError):
+        # not representable as feather (e.g. mixed type columns)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    replace_file(tmp_path, cache_path)
+    return True
+
+
+def read_csv_pandas(path):
+    '''read csv using pandas
+    '''
+    return pd.read_csv(path, quotechar='\"',
+                       na_values='', keep_default_na=False,
+                       encoding='utf-8')
+
+
+def csv_convert_options(**kwargs):
+    '''arrow csv convert options matching the pandas reader (empty fields,
+    quoted or not, are missing values) plus any extra options
+    '''
+    return pa_csv.ConvertOptions(null_values=[''], strings_can_be_null=True,
+                                 quoted_strings_can_be_null=True, **kwargs)
+
+
+def read_csv_arrow(path):
+    '''read csv using multithreaded pyarrow reader
+
+    column names are taken from pandas so that empty/duplicate headers
+    are named the same way ("Unnamed: 3", "name.1"). columns which arrow
+    infers as dates/timestamps are reread as strings to match pandas
+    '''
+    names = list(read_csv_header(path))
+
+    read_options = pa_csv.ReadOptions(column_names=names, skip_rows=1,
+                                      use_threads=True)
+    parse_options = pa_csv.ParseOptions(quote_char='\"')
+    convert_options = csv_convert_options()
+
+    table = pa_csv.read_csv(path, read_options=read_options,
+                            parse_options=parse_options,
+                            convert_options=convert_options)
+
+    date_cols = [f.name for f in table.schema
+                 if pa.types.is_timestamp(f.type) or pa.types.is_date(f.type)]
+
+    df = table.to_pandas()
+
+    if date_cols:
+        convert_options = csv_convert_options(
+            include_columns=date_cols,
+            column_types=dict((c, pa.string()) for c in date_cols))
+        date_df = pa_csv.read_csv(path, read_options=read_options,
+                                  parse_options=parse_options,
+                                  convert_options=convert_options).to_pandas()
+        for c in date_cols:
+            df[c] = date_df[c].values
+
+    return df
+
+
+def read_csv_header(path):
+    '''column names of csv as pandas would assign them
+    '''
+    return pd.read_csv(path, quotechar='\"', nrows=0,
+                       encoding='utf-8').columns
+
+
+def parse_csv(path):
+    '''parse csv text (arrow first, pandas as fallback)
+    '''
+    if not arrow_csv:
+        return read_csv_pandas(path)
+    try:
+        return read_csv_arrow(path)
+    except pa.ArrowInvalid:
+        return read_csv_pandas(path)
+
+
+# -----------------------------------------------------------------------------
+# column / row filter pushdown
+
+def filter_columns(columns, filters):
+    '''columns to read for requested columns and filters
+    '''
+    needed = list(columns) if columns is not None else None
+    if needed is not None:
+        needed += [f[0] for f in filters or [] if f[0] not in needed]
+    return needed
+
+
+def pandas_filter_mask(df, filters):
+    '''boolean mask of frame rows matching all filters
+    '''
+    mask = np.ones(len(df), dtype='bool')
+    for column, op, value in filters:
+        if op == 'in':
+            match = df[column].isin(value)
+        elif op == 'not in':
+            match = ~df[column].isin(value)
+        else:
+            match = filter_ops[op](df[column], value)
+        mask &= np.asarray(match, dtype='bool')
+    return mask
+
+
+def arrow_filter_mask(batch, filters):
+    '''boolean mask of arrow table/batch rows matching all filters
+
+    nulls are resolved to match pandas (only != and not in match them)
+    '''
+    mask = None
+    for column, op, value in filters:
+        values = batch.column(batch.schema.get_field_index(column))
+        if op in ['in', 'not in']:
+            match = pc.is_in(values, value_set=pa.array(list(value),
+                                                         type=values.type))
+            if op == 'not in':
+                match = pc.invert(match)
+        else:
+            match = arrow_ops[op](values, value)
+            match = pc.fill_null(match, op == '!=')
+        mask = match if mask is None else pc.and_(mask, match)
+    return mask
+
+
+def filter_frame(df, columns, filters):
+    '''apply filters to frame and select requested columns
+    '''
+    if filters:
+        df = df.loc[pandas_filter_mask(df, filters)].reset_index(drop=True)
+    return df[columns] if columns is not None else df
+
+
+def filter_table(table, columns, filters):
+    '''apply filters to arrow table and convert requested columns to pandas
+    '''
+    if filters and arrow_filters:
+        table = table.filter(arrow_filter_mask(table, filters))
+        filters = None
+    return filter_frame(table.to_pandas(), columns, filters)
+
+
+def read_feather_filtered(path, cache_path, columns, filters):
+    '''read columns of feather cache of csv and filter rows before conversion
+
+    columns are read by (sorted) position in the csv header, the cache has
+    the same columns and older pyarrow only takes str names or indices
+    '''
+    names = list(read_csv_header(path))
+    indices = sorted(names.index(c) for c in filter_columns(columns, filters))
+    table = pa_feather.read_table(cache_path, columns=indices)
+    return filter_table(table, columns, filters)
+
+
+def stream_csv_arrow(path, columns, filters):
+    '''read columns of csv batch by batch, keeping rows matching filters
+
+    column types are inferred from the first block. date/timestamp
+    columns are read as strings (as in read_csv_arrow)
+    '''
+    names = list(read_csv_header(path))
+    needed = filter_columns(columns, filters) or names
+
+    read_options = pa_csv.ReadOptions(column_names=names, skip_rows=1,
+                                      use_threads=True,
+                                      block_size=stream_block_size)
+    parse_options = pa_csv.ParseOptions(quote_char='"')
+
+    def open_reader(column_types):
+        convert_options = csv_convert_options(include_columns=needed,
+                                              column_types=column_types)
+        return pa_csv.open_csv(path, read_options=read_options,
+                               parse_options=parse_options,
+                               convert_options=convert_options)
+
+    reader = open_reader({})
+    date_cols = [f.name for f in reader.schema
+                 if pa.types.is_timestamp(f.type) or pa.types.is_date(f.type)]
+    if date_cols:
+        reader = open_reader(dict((c, pa.string()) for c in date_cols))
+
+    batches = []
+    for batch in reader:
+        if filters and arrow_filters:
+            batch = batch.filter(arrow_filter_mask(batch, filters))
+        batches.append(batch)
+
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    return filter_table(table, columns, None if arrow_filters else filters)
+
+
+def stream_csv_pandas(path, columns, filters):
+    '''read columns of csv in chunks, keeping rows matching filters
+    '''
+    needed = filter_columns(columns, filters)
+    chunks = pd.read_csv(path, quotechar='"',
+                         na_values='', keep_default_na=False,
+                         encoding='utf-8', usecols=needed,
+                         chunksize=stream_chunk_rows, low_memory=False)
+    parts = []
+    for chunk in chunks:
+        if filters:
+            chunk = chunk.loc[pandas_filter_mask(chunk, filters)]
+        parts.append(chunk)
+    return filter_frame(pd.concat(parts, ignore_index=True), columns, None)
+
+
+def stream_csv(path, columns, filters):
+    '''read only needed columns/rows of csv without a full load
+    '''
+    if arrow_stream:
+        try:
+            return stream_csv_arrow(path, columns, filters)
+        except pa.ArrowInvalid:
+            # ragged rows or types changing after the first block
+            pass
+    return stream_csv_pandas(path, columns, filters)
+
+
+# -----------------------------------------------------------------------------
+
+def read_csv(path, cache=True, columns=None, filters=None):
+    '''read csv, using feather cache next to the source when valid
+
+    falls back to the pandas parser for files arrow cannot parse
+    (e.g. ragged rows). when columns and/or filters are given only those
+    columns and matching rows are read (see module docstring). a missing
+    or stale cache is rebuilt from a full parse either way
+    '''
+    path = os.path.expanduser(path)
+    pushdown = columns is not None or bool(filters)
+
+    if not cache:
+        if pushdown:
+            return stream_csv(path, columns, filters)
+        return parse_csv(path)
+
+    cache_path = path + '.feather'
+    stat = file_stat([path])
+    meta = read_meta(cache_path)
+
+    if meta is None or meta['stat'] != stat:
+        sha = file_hash([path])
+        if meta is not None and meta['hash'] == sha:
+            # source touched but unchanged
+            meta = dict(meta, stat=stat)
+            write_meta(cache_path, meta)
+        else:
+            # cache written before its key, so a key always has its cache
+            df = parse_csv(path)
+            feather = write_cache(df, cache_path)
+            write_meta(cache_path, {'stat': stat, 'hash': sha,
+                                    'feather': feather})
+            return filter_frame(df, columns, filters)
+
+    if not meta.get('feather', True):
+        # known to have no cache (not representable as feather), parsed
+        # without hashing the source again
+        return filter_frame(parse_csv(path), columns, filters)
+
+    if pushdown:
+        return read_feather_filtered(path, cache_path, columns, filters)
+    return pd.read_feather(cache_path)
@@ -0,0 +1,128 @@
+"""
+vectorized ndvi period averages and pre-trend slopes
+
+the yearly ndvi fields are pulled into a single (rows x years) matrix and
+cumulative sums over the year axis are used to get the sum/count of any
+year window for every row at once. windows are defined per row by its
+implementation (transactions_start_year) year.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+ndvi_field = "ltdr_yearly_ndvi_mean.{0}.mean"
+
+
+def ndvi_matrix(data_df, first_year, last_year, field=ndvi_field):
+    '''matrix of yearly ndvi values for years [first_year, last_year]
+
+    returns (values, present) where values is float64 (rows x years) with
+    0 for years without a field and present marks years with a field
+    '''
+    years = range(first_year, last_year + 1)
+    values = np.zeros((len(data_df), len(years)), dtype='float64')
+    present = np.zeros(len(years), dtype='bool')
+    for i, year in enumerate(years):
+        cname = field.format(year)
+        if cname in data_df.columns:
+            values[:, i] = data_df[cname].values.astype('float64')
+            present[i] = True
+    return values, present
+
+
+def prefix_sums(values, present):
+    '''cumulative (row) sums over year axis with leading zero column
+
+    nan values are counted separately so that any window containing a nan
+    sums to nan (as when adding the values one at a time)
+    '''
+    n = values.shape[0]
+    x = np.arange(values.shape[1], dtype='float64')
+    is_nan = np.isnan(values)
+    clean = np.where(is_nan, 0, values)
+
+    def cumsum(a):
+        out = np.zeros((n, a.shape[1] + 1), dtype='float64')
+        out[:, 1:] = np.cumsum(a, axis=1)
+        return out
+
+    def cumsum_1d(a):
+        out = np.zeros(len(a) + 1, dtype='float64')
+        out[1:] = np.cumsum(a)
+        return out
+
+    return {
+        'count': cumsum_1d(present.astype('float64')),
+        'x': cumsum_1d(x * present),
+        'xx': cumsum_1d(x * x * present),
+        'y': cumsum(clean),
+        'xy': cumsum(clean * x),
+        'nan': cumsum(is_nan.astype('float64'))
+    }
+
+
+def window_sums(sums, lo, hi):
+    '''per row sums over year index window [lo, hi)
+    '''
+    rows = np.arange(len(lo))
+    out = {}
+    for k in ['count', 'x', 'xx']:
+        out[k] = sums[k][hi] - sums[k][lo]
+    for k in ['y', 'xy', 'nan']:
+        out[k] = sums[k][rows, hi] - sums[k][rows, lo]
+    out['y'][out['nan'] > 0] = np.nan
+    out['xy'][out['nan'] > 0] = np.nan
+    return out
+
+
+def window_mean(w):
+    '''mean of window (nan for empty window)
+    '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(w['count'] > 0, w['y'] / w['count'], np.nan)
+
+
+def window_slope(w):
+    '''least squares slope (per year) of window (nan for < 2 years)
+    '''
+    n = w['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = ((n * w['xy'] - w['x'] * w['y'])
+                 / (n * w['xx'] - w['x'] ** 2))
+    return np.where(n > 1, slope, np.nan)
+
+
+def ndvi_period_stats(data_df, start_field='transactions_start_year',
+                      first_year=2000, last_year=2013, field=ndvi_field):
+    '''ndvi averages and pre-trend slope relative to each row's start year
+
+    ndvi_pre_average     mean over years [start_year, last_year]
+    ndvi_post_average    mean over years [first_year, start_year)
+    ndvi_pretrend_slope  least squares slope over [first_year, start_year)
+
+    years without an ndvi field are skipped. returns dataframe aligned
+    with data_df
+    '''
+    start = data_df[start_field].values.astype('int64')
+
+    # matrix must cover earliest start year for the "pre" window
+    grid_start = min(first_year, int(start.min())) if len(start) else first_year
+    values, present = ndvi_matrix(data_df, grid_start, last_year, field=field)
+    sums = prefix_sums(values, present)
+
+    grid_len = values.shape[1]
+    start_ix = np.clip(start - grid_start, 0, grid_len)
+    first_ix = np.full(len(start), first_year - grid_start)
+    last_ix = np.full(len(start), grid_len)
+
+    pre = window_sums(sums, start_ix, last_ix)
+    post = window_sums(sums, first_ix, np.maximum(first_ix, start_ix))
+
+    return pd.DataFrame({
+        'ndvi_pre_average': window_mean(pre),
+        'ndvi_post_average': window_mean(post),
+        'ndvi_pretrend_slope': window_slope(post)
+    }, index=data_df.index,
+       columns=['ndvi_pre_average', 'ndvi_post_average',
+                'ndvi_pretrend_slope'])
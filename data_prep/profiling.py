@@ -0,0 +1,172 @@
+"""
+per step timing / memory instrumentation for the pipeline scripts
+
+scripts wrap each logical step in `step`:
+
+    with step('merge projects') as s:
+        data_df = data_df.merge(projects_df, on='project_id', how='left')
+        record_frame(s, data_df)
+
+instrumentation is enabled by setting GEF_PROFILE to a directory. each run
+of a script then writes <script>_<timestamp>.json there, with one record
+per step (wall/cpu time, current/peak rss, rows/columns of the frame
+recorded for the step) in the order steps started. setting
+GEF_PROFILE_TRACEMALLOC=1 also records the peak python allocations of each
+step (python 3 only, slows down allocation heavy steps).
+
+when GEF_PROFILE is not set `step` does nothing but yield a shared empty
+record, so steps can stay in place in production runs.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import resource
+from contextlib import contextmanager
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# process cpu time (time.clock on python 2)
+cpu_clock = getattr(time, 'process_time', None) or time.clock
+
+# record yielded by disabled steps
+null_record = {}
+
+# run state (report is None while disabled)
+state = {
+    'report': None,
+    'report_path': None,
+    'stack': [],
+    'trace': False
+}
+
+
+def current_rss_mb():
+    '''resident set size of process (None where /proc is not available)
+    '''
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError):
+        return None
+    return pages * resource.getpagesize() / 1024.0 ** 2
+
+
+def peak_rss_mb():
+    '''peak resident set size of process so far (ru_maxrss is kB on linux)
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def enable(report_path, trace_memory=False):
+    '''start recording steps, report is written to report_path at exit
+    '''
+    state['report'] = {
+        'script': os.path.basename(sys.argv[0]),
+        'argv': sys.argv[1:],
+        'start': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'steps': []
+    }
+    state['report_path'] = report_path
+    state['trace'] = trace_memory and tracemalloc is not None
+    state['t0'] = (time.time(), cpu_clock())
+    if state['trace']:
+        tracemalloc.start()
+    atexit.register(write_report)
+
+
+def enable_from_env():
+    '''enable instrumentation if GEF_PROFILE directory is set
+    '''
+    report_dir = os.environ.get('GEF_PROFILE')
+    if not report_dir or state['report'] is not None:
+        return
+    if not os.path.isdir(report_dir):
+        os.makedirs(report_dir)
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'python'
+    report_path = os.path.join(report_dir, '{0}_{1}.json'.format(
+        script, time.strftime('%Y%m%d_%H%M%S')))
+    trace = os.environ.get('GEF_PROFILE_TRACEMALLOC') in ['1', 'true', 'True']
+    enable(report_path, trace_memory=trace)
+
+
+@contextmanager
+def step(name):
+    '''time/measure the enclosed block as a named step
+    '''
+    if state['report'] is None:
+        yield null_record
+        return
+
+    stack = state['stack']
+    rec = {'name': name, 'depth': len(stack)}
+    state['report']['steps'].append(rec)
+    stack.append(rec)
+
+    if state['trace']:
+        # peak is reset for every step, so the peak of an enclosing step
+        # is carried up from its children
+        if len(stack) > 1:
+            stack[-2]['_alloc_peak'] = max(stack[-2].get('_alloc_peak', 0),
+                                           tracemalloc.get_traced_memory()[1])
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    t0, c0 = time.time(), cpu_clock()
+    rss0 = current_rss_mb()
+    try:
+        yield rec
+    finally:
+        rec['wall_time'] = time.time() - t0
+        rec['cpu_time'] = cpu_clock() - c0
+        rec['rss_mb'] = current_rss_mb()
+        if rss0 is not None and rec['rss_mb'] is not None:
+            rec['rss_delta_mb'] = rec['rss_mb'] - rss0
+        rec['peak_rss_mb'] = peak_rss_mb()
+        if state['trace']:
+            peak = max(rec.pop('_alloc_peak', 0),
+                       tracemalloc.get_traced_memory()[1])
+            rec['alloc_peak_mb'] = peak / 1024.0 ** 2
+            if len(stack) > 1:
+                stack[-2]['_alloc_peak'] = max(
+                    stack[-2].get('_alloc_peak', 0), peak)
+        stack.pop()
+
+
+def record_frame(rec, df):
+    '''record row/column count of step output frame
+    '''
+    if rec is null_record:
+        return
+    rec['rows'] = int(df.shape[0])
+    rec['columns'] = int(df.shape[1]) if len(df.shape) > 1 else 1
+
+
+def record_info(rec, **info):
+    '''record extra values (e.g. counts) for step
+    '''
+    if rec is null_record:
+        return
+    rec.update(info)
+
+
+def write_report():
+    '''write report of recorded steps (no-op while disabled)
+    '''
+    report = state['report']
+    if report is None:
+        return
+    report['wall_time'] = time.time() - state['t0'][0]
+    report['cpu_time'] = cpu_clock() - state['t0'][1]
+    report['peak_rss_mb'] = peak_rss_mb()
+    with open(state['report_path'], 'w') as f:
+        json.dump(report, f, indent=4)
+
+
+enable_from_env()
@@ -0,0 +1,360 @@
+"""
+benchmark pipeline stages and hot paths on synthetic data
+
+for each scale a synthetic raw_data tree is generated (see
+synthetic_data.py) in a work directory along with a copy of the pipeline
+code, then:
+
+    stages      every pipeline stage (see run_pipeline.py) is run as its
+                own process, recording wall/cpu time and peak rss along
+                with the per step report of the stage (see profiling.py)
+    hot paths   individual steps (csv load, iba join, ndvi averages, wdpa
+                centroids/resolve, component tags) are timed in process
+                (best of --repeat runs) with peak traced allocations
+                where tracemalloc is available
+
+results of each run are saved to results/benchmarks/ and compared against
+the previous run so regressions show up as ratios.
+
+usage (from repo root):
+
+    python data_prep/run_benchmarks.py                # scales 1 10 100
+    python data_prep/run_benchmarks.py --scales 1 10 --repeat 5
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import numpy as np
+import pandas as pd
+
+from load_data import read_csv
+from iba_index import build_iba_tree, nearest_iba, iba_radius_features
+from ndvi import ndvi_period_stats
+from wdpa_centroids import (build_wdpa_centroids, wdpa_feature_ids,
+                            explode_wdpa_ids, resolve_wdpa_coords)
+from components import component_tags
+from synthetic_data import generate_dataset, aiddata_dir
+from run_pipeline import stages
+
+
+if os.environ.get('USER') in ["vagrant", "ubuntu"]:
+    repo_dir = os.path.dirname(
+        os.path.dirname(os.path.realpath(__file__)))
+else:
+    repo_dir = os.path.realpath(".")
+
+
+# pipeline code copied into each synthetic tree
+code_files = ['data_prep/*.py', 'analysis/round_01/project_stats.py']
+
+results_dir = "{0}/results/benchmarks".format(repo_dir)
+
+# process cpu time (time.clock on python 2)
+cpu_clock = getattr(time, 'process_time', None) or time.clock
+
+
+# -----------------------------------------------------------------------------
+# stages
+
+def copy_code(tree_dir):
+    '''copy pipeline code into synthetic tree
+    '''
+    for pattern in code_files:
+        for src in glob.glob(os.path.join(repo_dir, pattern)):
+            dst = os.path.join(tree_dir, os.path.relpath(src, repo_dir))
+            if not os.path.isdir(os.path.dirname(dst)):
+                os.makedirs(os.path.dirname(dst))
+            shutil.copy(src, dst)
+
+
+def profile_stage(tree_dir, stage):
+    '''run stage script in tree, returns timing/memory of its process
+
+    peak rss is that of the stage process or any of its (pool) workers.
+    the per step report of the stage (see profiling.py) is included
+    '''
+    log_path = os.path.join(tree_dir, '{0}.log'.format(stage['name']))
+    profile_dir = os.path.join(tree_dir, 'profile', stage['name'])
+    env = dict(os.environ, GEF_PROFILE=profile_dir)
+    with open(log_path, 'w') as log:
+        t0 = time.time()
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(tree_dir, stage['script'])],
+            cwd=tree_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.time() - t0
+
+    if os.WIFEXITED(status):
+        proc.returncode = os.WEXITSTATUS(status)
+    else:
+        proc.returncode = -os.WTERMSIG(status)
+
+    steps = None
+    for path in glob.glob(os.path.join(profile_dir, '*.json')):
+        with open(path, 'r') as f:
+            steps = json.load(f)['steps']
+
+    return {
+        'exit_status': proc.returncode,
+        'wall_time': wall,
+        'cpu_time': usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is kB on linux
+        'peak_rss_mb': usage.ru_maxrss / 1024.0,
+        'steps': steps,
+        'log': log_path
+    }
+
+
+# -----------------------------------------------------------------------------
+# hot paths
+
+def load_inputs(tree_dir):
+    '''raw frames used by hot path benchmarks
+    '''
+    path = lambda p: os.path.join(tree_dir, p)
+
+    inputs = {}
+    inputs['treatments_csv'] = path('raw_data/merge_gef_treatments.csv')
+    inputs['treatments'] = read_csv(inputs['treatments_csv'], cache=False)
+    inputs['controls'] = read_csv(path('raw_data/merge_gef_controls.csv'),
+                                  cache=False)
+
+    iba_df = read_csv(path('raw_data/iba/IBA monitoring data 4 Nov 2015.csv'),
+                      cache=False)
+    iba_df = iba_df.loc[iba_df['StateScore'] != 5]
+    iba_df = iba_df.sort_values(by='MonitoringYear', ascending=1)
+    inputs['iba'] = iba_df.groupby('SiteID').last()
+
+    projects_df = read_csv(path(aiddata_dir + '/projects.csv'), cache=False)
+    start = projects_df['transactions_start_year'].dropna().values
+    rng = np.random.RandomState(0)
+    inputs['start_year'] = rng.choice(start, len(inputs['treatments']))
+
+    wdpa_2014_df = read_csv(
+        path('raw_data/wdpa/IUCN GEF Project and PA Database 24Oct (2014).csv'),
+        cache=False)
+    wdpa_2014_df = wdpa_2014_df[['PMIS GEF ID', 'WDPA ID1', 'WDPA ID2',
+                                 'WDPA ID3', 'WDPA ID4']]
+    wdpa_2014_df.columns = ['gef_id', 'wdpa01', 'wdpa02', 'wdpa03', 'wdpa04']
+    wdpa_2015_df = read_csv(
+        path('raw_data/wdpa/PAsList (from Najeeb - 28 JUL 2015).csv'),
+        cache=False)
+    wdpa_2015_df = wdpa_2015_df[['gef_id', 'WDPA ID', 'Other WDPA IDs']]
+    wdpa_2015_df.columns = ['gef_id', 'wdpa01', 'wdpa02']
+    inputs['gef_wdpa'] = pd.concat([wdpa_2014_df, wdpa_2015_df])
+    inputs['wdpa_shp'] = path('raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.shp')
+    inputs['wdpa_centroids'] = build_wdpa_centroids(inputs['wdpa_shp'])
+
+    inputs['ancillary'] = [
+        read_csv(path('raw_data/ancillary/' + f), cache=False)
+        for f in ['CD_MFA_CD_projects_sheet.csv',
+                  'CD_MFA_MFA_projects_sheet.csv',
+                  'GEF_MFA_AidData_Ancillary.csv']]
+    return inputs
+
+
+def bench_read_csv(inputs):
+    read_csv(inputs['treatments_csv'], cache=False)
+
+
+def bench_iba_join(inputs):
+    lon = np.concatenate([inputs['treatments']['longitude'].values,
+                          inputs['controls']['longitude'].values])
+    lat = np.concatenate([inputs['treatments']['latitude'].values,
+                          inputs['controls']['latitude'].values])
+    tree = build_iba_tree(inputs['iba'])
+    nearest_iba(tree, inputs['iba'], lon, lat)
+    iba_radius_features(tree, inputs['iba'], lon, lat, radii=[10, 25, 50])
+
+
+def bench_ndvi_averages(inputs):
+    data_df = inputs['treatments'].assign(
+        transactions_start_year=inputs['start_year'])
+    ndvi_period_stats(data_df)
+
+
+def bench_wdpa_centroids(inputs):
+    build_wdpa_centroids(inputs['wdpa_shp'])
+
+
+def bench_wdpa_prefiltered(inputs):
+    fields = ['wdpa01', 'wdpa02', 'wdpa03', 'wdpa04']
+    long_df = explode_wdpa_ids(inputs['gef_wdpa'], fields)
+    fids = wdpa_feature_ids(inputs['wdpa_shp'], set(long_df['wdpa_id']))
+    build_wdpa_centroids(inputs['wdpa_shp'], fids=fids)
+
+
+def bench_wdpa_resolve(inputs):
+    fields = ['wdpa01', 'wdpa02', 'wdpa03', 'wdpa04']
+    long_df = explode_wdpa_ids(inputs['gef_wdpa'], fields)
+    resolve_wdpa_coords(long_df, inputs['wdpa_centroids'],
+                        len(inputs['gef_wdpa']))
+
+
+def bench_component_tags(inputs):
+    cd_df, mfa_df, aiddata_df = inputs['ancillary']
+    component_tags(cell_sheets=[(cd_df, 'GEF ID'), (mfa_df, 'GEF ID')],
+                   keyword_sheets=[(aiddata_df, 'GEF_ID', 'Sub-Foci')])
+
+
+hot_paths = [
+    ('read_csv', bench_read_csv),
+    ('iba_join', bench_iba_join),
+    ('ndvi_averages', bench_ndvi_averages),
+    ('wdpa_centroids', bench_wdpa_centroids),
+    ('wdpa_prefiltered', bench_wdpa_prefiltered),
+    ('wdpa_resolve', bench_wdpa_resolve),
+    ('component_tags', bench_component_tags)
+]
+
+
+def profile_call(func, inputs, repeat):
+    '''best wall/cpu time over repeat calls and peak traced allocations
+    '''
+    wall, cpu = [], []
+    for _ in range(repeat):
+        t0, c0 = time.time(), cpu_clock()
+        func(inputs)
+        wall.append(time.time() - t0)
+        cpu.append(cpu_clock() - c0)
+
+    peak_mb = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        func(inputs)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 1024.0 ** 2
+        tracemalloc.stop()
+
+    return {'wall_time': min(wall), 'cpu_time': min(cpu),
+            'peak_alloc_mb': peak_mb}
+
+
+# -----------------------------------------------------------------------------
+# results
+
+def previous_results():
+    '''most recent saved benchmark results (None if there are none)
+    '''
+    paths = sorted(glob.glob(os.path.join(results_dir, 'benchmark_*.json')))
+    if not paths:
+        return None
+    with open(paths[-1], 'r') as f:
+        return json.load(f)
+
+
+def compare(results, previous):
+    '''wall time ratio (current / previous) of every stage and hot path
+    '''
+    ratios = {}
+    for scale, current in results['scales'].items():
+        prev = previous['scales'].get(scale)
+        if prev is None:
+            continue
+        for group in ['stages', 'hot_paths']:
+            for name, r in current[group].items():
+                p = prev[group].get(name)
+                if p is not None and p['wall_time'] > 0:
+                    ratios['{0}x {1}'.format(scale, name)] = (
+                        r['wall_time'] / p['wall_time'])
+    return ratios
+
+
+def run_benchmarks(scales, repeat=3, work_dir=None, keep=False, seed=0):
+    '''generate data and benchmark stages/hot paths at every scale
+    '''
+    results = {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'scales': {}
+    }
+
+    base_dir = work_dir or tempfile.mkdtemp(prefix='gef_benchmark_')
+
+    for scale in scales:
+        tree_dir = os.path.join(base_dir, 'scale_{0}'.format(scale))
+        if os.path.isdir(tree_dir):
+            shutil.rmtree(tree_dir)
+        os.makedirs(tree_dir)
+
+        print "Generating scale {0} data...".format(scale)
+        t0 = time.time()
+        rows = generate_dataset(tree_dir, scale=scale, seed=seed)
+        copy_code(tree_dir)
+        scale_results = {'rows': rows, 'generate_time': time.time() - t0,
+                         'stages': {}, 'hot_paths': {}}
+
+        for stage in stages:
+            print "Scale {0}: stage {1}".format(scale, stage['name'])
+            scale_results['stages'][stage['name']] = profile_stage(tree_dir, stage)
+
+        inputs = load_inputs(tree_dir)
+        for name, func in hot_paths:
+            print "Scale {0}: hot path {1}".format(scale, name)
+            scale_results['hot_paths'][name] = profile_call(func, inputs, repeat)
+
+        results['scales'][str(scale)] = scale_results
+
+        if not keep:
+            shutil.rmtree(tree_dir)
+
+    if not keep and work_dir is None:
+        shutil.rmtree(base_dir)
+
+    return results
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scales', nargs='+', type=int, default=[1, 10, 100],
+                        help='data scales to benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each hot path (best is kept)')
+    parser.add_argument('--work-dir', default=None,
+                        help='where to generate synthetic data (default: temp)')
+    parser.add_argument('--keep', action='store_true',
+                        help='keep generated data and stage logs')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, repeat=args.repeat,
+                             work_dir=args.work_dir, keep=args.keep)
+
+    previous = previous_results()
+
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+    out_path = os.path.join(
+        results_dir, 'benchmark_{0}.json'.format(time.strftime('%Y%m%d_%H%M%S')))
+    with open(out_path, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+    for scale in args.scales:
+        scale_results = results['scales'][str(scale)]
+        for group in ['stages', 'hot_paths']:
+            for name, r in sorted(scale_results[group].items()):
+                failed = r.get('exit_status', 0) != 0
+                print "{0}x {1:<16} {2:>9.3f}s{3}".format(
+                    scale, name, r['wall_time'], ' (failed)' if failed else '')
+
+    if previous is not None:
+        print "Wall time relative to {0}:".format(previous['time'])
+        for name, ratio in sorted(compare(results, previous).items()):
+            print "{0:<24} {1:>6.2f}x".format(name, ratio)
+
+    print "Results saved to {0}".format(out_path)
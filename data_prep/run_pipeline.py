@@ -0,0 +1,317 @@
+"""
+incremental runner for the data prep / analysis pipeline
+
+each stage declares the files it reads (including its own code) and the
+files it writes. a stage is skipped when the content hashes of its inputs
+match those recorded the last time it ran and its outputs still exist with
+the recorded hashes. each stage is started as soon as the stages it
+depends on have finished (so stages whose dependencies are satisfied run
+concurrently), and a change to a single input only reruns the stages
+downstream of it.
+
+usage (from repo root):
+
+    python data_prep/run_pipeline.py              # run out of date stages
+    python data_prep/run_pipeline.py --force      # rerun every stage
+    python data_prep/run_pipeline.py cases stats  # only these stages
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from load_data import file_hash
+from case_definitions import case_definitions
+
+
+if os.environ.get('USER') in ["vagrant", "ubuntu"]:
+    repo_dir = os.path.dirname(
+        os.path.dirname(os.path.realpath(__file__)))
+else:
+    repo_dir = os.path.realpath(".")
+
+
+aiddata_dir = "raw_data/aiddata/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data"
+
+# case csvs written by build_analysis_cases (csv case export)
+case_outputs = ['data_prep/analysis_cases/{0}_data.csv'.format(c['name'])
+                for c in case_definitions]
+
+stages = [
+    {
+        'name': 'wdpa',
+        'script': 'data_prep/build_wdpa_bio_data.py',
+        'inputs': [
+            'data_prep/load_data.py',
+            'data_prep/profiling.py',
+            'data_prep/wdpa_centroids.py',
+            'data_prep/geo_export.py',
+            'raw_data/wdpa/IUCN GEF Project and PA Database 24Oct (2014).csv',
+            'raw_data/wdpa/PAsList (from Najeeb - 28 JUL 2015).csv',
+            'raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.shp',
+            'raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.shx',
+            'raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.dbf'
+        ],
+        'outputs': [
+            'raw_data/external_bio.geojson'
+        ]
+    },
+    {
+        'name': 'merge',
+        'script': 'data_prep/build_merge.py',
+        'inputs': [
+            'data_prep/load_data.py',
+            'data_prep/profiling.py',
+            'data_prep/gef_id_registry.py',
+            'data_prep/enrichment.py',
+            'data_prep/iba_index.py',
+            'data_prep/lazy_geometry.py',
+            'raw_data/merge_gef_treatments.csv',
+            'raw_data/treatments_location_id.csv',
+            aiddata_dir + '/projects_ancillary.csv',
+            aiddata_dir + '/locations.csv',
+            aiddata_dir + '/projects.csv',
+            'raw_data/ancillary/master_gef_projects.csv',
+            'raw_data/ancillary/mfa_funding_breakdown.csv',
+            'raw_data/merge_gef_controls.csv',
+            'raw_data/iba/IBA monitoring data 4 Nov 2015.csv'
+        ],
+        'outputs': [
+            'data_prep/merged_data.csv'
+        ]
+    },
+    {
+        'name': 'wdpa_join',
+        'script': 'data_prep/build_wdpa_join.py',
+        'inputs': [
+            'data_prep/load_data.py',
+            'data_prep/profiling.py',
+            'data_prep/wdpa_centroids.py',
+            'data_prep/iba_index.py',
+            'data_prep/wdpa_index.py',
+            'data_prep/lazy_geometry.py',
+            'data_prep/merged_data.csv',
+            'raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.shp',
+            'raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.shx',
+            'raw_data/wdpa/shps/WDPA_Dec2016_poly_simp.dbf'
+        ],
+        'outputs': [
+            'data_prep/wdpa_join.csv'
+        ]
+    },
+    {
+        'name': 'cases',
+        'script': 'data_prep/build_analysis_cases.py',
+        'inputs': [
+            'data_prep/load_data.py',
+            'data_prep/profiling.py',
+            'data_prep/compact_dtypes.py',
+            'data_prep/gef_id_registry.py',
+            'data_prep/components.py',
+            'data_prep/start_year.py',
+            'data_prep/ndvi.py',
+            'data_prep/case_definitions.py',
+            'data_prep/case_builder.py',
+            'data_prep/case_query.py',
+            'data_prep/shared_table.py',
+            'data_prep/lazy_geometry.py',
+            'data_prep/merged_data.csv',
+            'raw_data/ancillary/CD_MFA_CD_projects_sheet.csv',
+            'raw_data/ancillary/CD_MFA_MFA_projects_sheet.csv',
+            'raw_data/ancillary/GEF_MFA_AidData_Ancillary.csv',
+            'raw_data/ancillary/gef_projects_160726.csv',
+            'raw_data/ancillary/programmatic_list.csv',
+            'raw_data/ancillary/nocd_lists.csv'
+        ],
+        'outputs': [
+            'data_prep/analysis_cases/base_data.csv',
+            'data_prep/analysis_cases/base_data.arrow',
+            'data_prep/analysis_cases/case_index.npz',
+            'data_prep/analysis_cases/manifest.json'
+        ] + case_outputs
+    },
+    {
+        'name': 'stats',
+        'script': 'analysis/round_01/project_stats.py',
+        'inputs': [
+            'data_prep/load_data.py',
+            'data_prep/profiling.py',
+            'data_prep/compact_dtypes.py',
+            'data_prep/shared_table.py',
+            'data_prep/analysis_cases/base_data.csv',
+            'data_prep/analysis_cases/base_data.arrow'
+        ],
+        'outputs': [
+            'results/mfa_project_stats.csv',
+            'results/land_project_stats.csv',
+            'results/bio_project_stats.csv'
+        ]
+    }
+]
+
+
+def stage_dependencies(stages):
+    '''names of stages producing any input of each stage
+    '''
+    producer = dict((out, s['name']) for s in stages for out in s['outputs'])
+    deps = {}
+    for s in stages:
+        files = s['inputs'] + [s['script']]
+        deps[s['name']] = set(producer[f] for f in files
+                              if f in producer and producer[f] != s['name'])
+    return deps
+
+
+def content_hash(rel_path, hash_cache):
+    '''content hash of file (None if missing)
+
+    stored hash in hash_cache is reused while file size/mtime match
+    '''
+    path = os.path.join(repo_dir, rel_path)
+    if not os.path.isfile(path):
+        return None
+    st = os.stat(path)
+    stat = [st.st_size, st.st_mtime]
+    entry = hash_cache.get(rel_path)
+    if entry is None or entry['stat'] != stat:
+        entry = {'stat': stat, 'hash': file_hash([path])}
+        hash_cache[rel_path] = entry
+    return entry['hash']
+
+
+def stage_hashes(stage, hash_cache, key):
+    '''hash of each input (or output) file of stage
+    '''
+    files = stage[key] + ([stage['script']] if key == 'inputs' else [])
+    return dict((f, content_hash(f, hash_cache)) for f in files)
+
+
+def stage_is_current(stage, state, hash_cache):
+    '''check if stage inputs/outputs match last successful run
+    '''
+    prev = state.get(stage['name'])
+    if prev is None:
+        return False
+    outputs = stage_hashes(stage, hash_cache, 'outputs')
+    if any(h is None for h in outputs.values()):
+        return False
+    return (prev['inputs'] == stage_hashes(stage, hash_cache, 'inputs')
+            and prev['outputs'] == outputs)
+
+
+def run_stage(stage):
+    '''run stage script from repo root, returns exit code
+    '''
+    script = os.path.join(repo_dir, stage['script'])
+    return subprocess.call([sys.executable, script], cwd=repo_dir)
+
+
+def queue_stage(stage, done):
+    '''run stage and put (stage name, exit code) on done queue
+    '''
+    code = 1
+    try:
+        code = run_stage(stage)
+    finally:
+        done.put((stage['name'], code))
+
+
+def run_pipeline(stages, state_path, selected=None, force=False,
+                 processes=None):
+    '''run out of date stages, each as soon as its dependencies finish
+
+    returns dict of stage name to "ran", "skipped" or "failed"
+    '''
+    state = {'stages': {}, 'hashes': {}}
+    if os.path.isfile(state_path):
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+
+    hash_cache = state['hashes']
+    deps = stage_dependencies(stages)
+    if selected is None:
+        selected = [s['name'] for s in stages]
+
+    status = {}
+    # input hashes of running stages, taken before the stage starts so
+    # that inputs changed during the run trigger a rerun next time
+    running = {}
+    done = Queue()
+    pool = ThreadPool(processes or len(stages))
+
+    try:
+        while len(status) < len(stages):
+            # settle every stage whose dependencies have finished
+            # (skipped / failed stages may make further stages ready)
+            ready = True
+            while ready:
+                ready = [s for s in stages if s['name'] not in status
+                         and s['name'] not in running
+                         and all(d in status for d in deps[s['name']])]
+                for s in ready:
+                    if any(status[d] == 'failed' for d in deps[s['name']]):
+                        status[s['name']] = 'failed'
+                    elif s['name'] not in selected:
+                        status[s['name']] = 'skipped'
+                    elif not force and stage_is_current(s, state['stages'], hash_cache):
+                        status[s['name']] = 'skipped'
+                    else:
+                        print "Running stage: {0}".format(s['name'])
+                        running[s['name']] = stage_hashes(s, hash_cache, 'inputs')
+                        pool.apply_async(queue_stage, (s, done))
+
+            if len(status) == len(stages):
+                break
+            if not running:
+                raise Exception("Circular stage dependencies")
+
+            # wait for any running stage
+            name, code = done.get()
+            inputs = running.pop(name)
+            if code != 0:
+                status[name] = 'failed'
+                state['stages'].pop(name, None)
+                continue
+            stage = [s for s in stages if s['name'] == name][0]
+            status[name] = 'ran'
+            state['stages'][name] = {
+                'inputs': inputs,
+                'outputs': stage_hashes(stage, hash_cache, 'outputs')
+            }
+    finally:
+        pool.close()
+        pool.join()
+
+        with open(state_path, 'w') as f:
+            json.dump(state, f, indent=4, sort_keys=True)
+
+    return status
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stages', nargs='*',
+                        help='stages to run (default: all)')
+    parser.add_argument('--force', action='store_true',
+                        help='rerun stages even if inputs are unchanged')
+    args = parser.parse_args()
+
+    state_path = "{0}/data_prep/pipeline_state.json".format(repo_dir)
+
+    status = run_pipeline(stages, state_path,
+                          selected=args.stages or None, force=args.force)
+
+    for s in stages:
+        print "{0}: {1}".format(s['name'], status[s['name']])
+
+    if 'failed' in status.values():
+        sys.exit(1)
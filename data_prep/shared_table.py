@@ -0,0 +1,126 @@
+"""
+memory mapped base table shared by worker processes
+
+the prepared base data is written once as an uncompressed arrow ipc file.
+processes attach to it through a memory map, so column buffers are pages
+of the file in the os page cache rather than private copies, and any
+number of workers reading the table use about the same memory as one.
+
+numeric columns are written without null bitmaps (nan stays nan) so they
+are handed out as read only views of the mapped file. categoricals are
+written as dictionary arrays and strings as arrow strings (these are
+decoded per process).
+
+the table is written next to the csv copy of the same data. readers only
+use it when it is at least as new as that csv (see shared_table_current),
+so a csv rewritten without its table is never shadowed by old data.
+"""
+
+import os
+
+import numpy as np
+import pyarrow as pa
+
+from load_data import (filter_columns, arrow_filter_mask, pandas_filter_mask,
+                       arrow_filters)
+
+
+def arrow_array(series):
+    '''arrow array of frame column
+
+    numeric values are kept as is (nan is not turned into null) so the
+    column buffer can be mapped back without conversion
+    '''
+    values = series.values
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'biuf':
+        return pa.array(values)
+    try:
+        return pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        # mixed type object columns are stored as strings
+        text = series.astype('str').where(series.notnull(), None)
+        return pa.array(text, from_pandas=True)
+
+
+def table_from_frame(df):
+    '''arrow table of frame (single chunk per column)
+    '''
+    columns = [str(c) for c in df.columns]
+    arrays = [arrow_array(df.iloc[:, i]) for i in range(df.shape[1])]
+    return pa.Table.from_arrays(arrays, names=columns)
+
+
+def write_shared_table(df, path):
+    '''write frame as uncompressed arrow ipc file
+
+    written to a temporary file first, so processes attaching during a
+    rewrite still see the complete previous table
+    '''
+    table = table_from_frame(df)
+    tmp_path = path + '.tmp'
+    sink = pa.OSFile(tmp_path, 'wb')
+    try:
+        writer = pa.RecordBatchFileWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+    finally:
+        sink.close()
+    if os.path.exists(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+def attach_shared_table(path):
+    '''arrow table backed by memory map of ipc file (nothing is read yet)
+    '''
+    return pa.RecordBatchFileReader(pa.memory_map(path, 'r')).read_all()
+
+
+def shared_table_current(path, source_path):
+    '''whether shared table exists and is not older than the csv
+    holding the same data
+    '''
+    if not os.path.isfile(path):
+        return False
+    if not os.path.isfile(source_path):
+        return True
+    return os.path.getmtime(path) >= os.path.getmtime(source_path)
+
+
+def select_columns(table, names):
+    '''table of named columns (in given order)
+    '''
+    return pa.Table.from_arrays(
+        [table.column(table.schema.get_field_index(c)) for c in names],
+        names=names)
+
+
+def shared_frame(table, columns=None, filters=None):
+    '''frame of shared table columns
+
+    without filters numeric columns are views of the mapped file (one
+    block per column, so pandas does not consolidate them into a copy).
+    filters (see load_data.py) select rows before conversion and the
+    result is then a copy of only the selected rows
+    '''
+    needed = filter_columns(columns, filters)
+    if needed is not None:
+        table = select_columns(table, needed)
+    if filters and arrow_filters:
+        table = table.filter(arrow_filter_mask(table, filters))
+        filters = None
+    try:
+        df = table.to_pandas(split_blocks=True)
+    except TypeError:
+        # pyarrow < 0.17 has no split_blocks (columns are consolidated)
+        df = table.to_pandas()
+    if filters:
+        df = df.loc[pandas_filter_mask(df, filters)].reset_index(drop=True)
+    return df[columns] if columns is not None else df
+
+
+def read_shared_table(path, columns=None, filters=None):
+    '''columns / rows of shared table as frame (see shared_frame)
+    '''
+    return shared_frame(attach_shared_table(path), columns=columns,
+                        filters=filters)
@@ -0,0 +1,82 @@
+"""
+implementation (start) year imputation
+
+the start year of each project location is taken from the first available
+source in priority order:
+
+    transactions        transactions_start_year from aiddata projects table
+    implementation      "Actual date of implementation start"
+    ceo_approval        "Date of CEO approval (MSP / EA)" (MSP/EA projects)
+    ceo_endorsement     "Date of CEO endorsement (FSP)" (FP projects)
+    project_approval    "Date of project approval"
+    default             fixed default year
+
+random control points get a random year drawn in a single seeded call
+(source "random").
+"""
+
+import numpy as np
+import pandas as pd
+
+
+# (source name, date field, required "Type acronym" values)
+date_sources = [
+    ('implementation', 'Actual date of implementation start', None),
+    ('ceo_approval', 'Date of CEO approval (MSP / EA)', ['MSP', 'EA']),
+    ('ceo_endorsement', 'Date of CEO endorsement (FSP)', ['FP']),
+    ('project_approval', 'Date of project approval', None)
+]
+
+
+def dates_to_years(dates):
+    '''year of dd-mmm-yy date strings (nan where missing/invalid)
+
+    each unique date string is only parsed once. two digit years > 20
+    are 19xx, all others 20xx
+    '''
+    codes, uniques = pd.factorize(pd.Series(dates).astype('object'))
+    partial = pd.to_numeric(
+        pd.Series(uniques, dtype='object').astype('str').str.split('-').str[2],
+        errors='coerce').values
+    unique_years = np.where(partial > 20, 1900 + partial, 2000 + partial)
+    unique_years = np.append(unique_years, np.nan)
+    # factorize codes missing values as -1 (last element)
+    return unique_years[codes]
+
+
+def impute_start_year(data_df, random_range=(2002, 2013), default_year=2012,
+                      seed=None):
+    '''start year and the source which supplied it for every row
+
+    returns dataframe aligned with data_df with transactions_start_year
+    and start_year_source fields
+    '''
+    is_rand = (data_df['type'] == 'rand').values
+    type_acronym = data_df['Type acronym']
+
+    year = pd.to_numeric(data_df['transactions_start_year'],
+                         errors='coerce').values.astype('float64')
+    source = np.where(np.isnan(year), '', 'transactions').astype('object')
+
+    for name, field, acronyms in date_sources:
+        candidate = dates_to_years(data_df[field].values)
+        fill = np.isnan(year) & ~np.isnan(candidate)
+        if acronyms is not None:
+            fill &= type_acronym.isin(acronyms).values
+        year[fill] = candidate[fill]
+        source[fill] = name
+
+    fill = np.isnan(year)
+    year[fill] = default_year
+    source[fill] = 'default'
+
+    rng = np.random.RandomState(seed)
+    year[is_rand] = rng.randint(random_range[0], random_range[1] + 1,
+                                size=is_rand.sum())
+    source[is_rand] = 'random'
+
+    return pd.DataFrame({
+        'transactions_start_year': year,
+        'start_year_source': source
+    }, index=data_df.index,
+       columns=['transactions_start_year', 'start_year_source'])
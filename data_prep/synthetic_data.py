@@ -0,0 +1,471 @@
+"""
+synthetic input data for benchmarking the pipeline at arbitrary scale
+
+writes a raw_data tree with the same files, field names and key
+relationships as the real inputs read by build_wdpa_bio_data.py,
+build_merge.py and build_analysis_cases.py:
+
+    extracts    treatment/control locations with the wide geo(query)
+                extract fields (ltdr_*, lossyr25.*, gpw_*, udel_*, ...)
+    aiddata     projects, locations and projects_ancillary tables
+    ancillary   gef project records, mfa funding, cd/mfa sheets,
+                programmatic and nocd lists
+    iba         iba monitoring records (multiple years per site)
+    wdpa        gef/wdpa id sheets and a polygon shapefile
+
+row counts are `base_counts` multiplied by scale. values are random but
+generated from a fixed seed so a given scale always produces the same data.
+"""
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+
+aiddata_dir = "raw_data/aiddata/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data"
+
+# row counts at scale 1
+base_counts = {
+    'projects': 500,
+    'controls': 2000,
+    'iba_sites': 2000,
+    'wdpa_polygons': 2000,
+    'wdpa_2014': 300,
+    'wdpa_2015': 200
+}
+
+# max number of locations per project
+max_project_locations = 8
+
+rounds = ["Programmatic", "MFA", "Biodiversity", "Land Degradation"]
+
+gef_phases = ["GEF - 1", "GEF - 2", "GEF - 3", "GEF - 4", "GEF - 5",
+              "GEF - 6", None]
+
+location_type_codes = ['ADM1', 'ADM2', 'PPL', 'PPLA', 'PCLI', 'CONT']
+
+focal_area_codes = ['M', 'BD', 'LD', 'CCM', 'CCA', 'IW', 'CW']
+
+sub_foci = ["Biodiversity", "Land Degradation", "Climate Change",
+            "International Waters", "SFM", "REDD", "Chemicals"]
+
+funding_categories = [
+    "GET_BD_", "GET_CC_", "GET_IW_", "GET_LD_", "GET_Multi focal area_",
+    "GET_M_Capacity building", "GET_M_SFM", "GET_Ozone_", "GET_POPs_",
+    "GET_P_HG", "LDCF_CC_", "NPIF_BD_", "SCCF_CC_"
+]
+
+date_fields = [
+    'Actual date of implementation start',
+    'Date of CEO approval (MSP / EA)',
+    'Date of CEO endorsement (FSP)',
+    'Date of project approval'
+]
+
+month_names = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def extract_fields():
+    '''(field, kind) of every extract field in real extract order
+    '''
+    fields = [
+        ('dist_to_all_rivers.na.mean', 'distance'),
+        ('dist_to_roads.na.mean', 'distance'),
+        ('srtm_elevation_500m.na.mean', 'elevation'),
+        ('srtm_slope_500m.na.mean', 'slope'),
+        ('accessibility_map.na.mean', 'distance')
+    ]
+    fields += [('gpw_v3_density.{0}.mean'.format(y), 'density')
+               for y in [1990, 1995, 2000]]
+    fields += [('gpw_v4_density.{0}.mean'.format(y), 'density')
+               for y in [2000, 2005, 2010, 2015]]
+    for stat in ['max', 'mean']:
+        fields += [('ltdr_yearly_ndvi_{0}.{1}.mean'.format(stat, y), 'ndvi')
+                   for y in range(1981, 2015)]
+    for var in ['precip', 'air_temp']:
+        for stat in ['max', 'mean', 'min']:
+            fields += [('udel_{0}_v4_01_yearly_{1}.{2}.mean'.format(var, stat, y),
+                        var) for y in range(1980, 2015)]
+    fields += [('v4composites_calibrated.{0}.mean'.format(y), 'lights')
+               for y in range(1992, 2014)]
+    fields += [('treecover2000.na.mean', 'percent'),
+               ('00forest25.na.sum', 'fraction'),
+               ('wdpa_5km.na.sum', 'fraction'),
+               ('wdpa_5km.na.count', 'count')]
+    for loss in ['lossyear', 'lossyr25']:
+        fields += [('{0}.na.categorical_count'.format(loss), 'count'),
+                   ('{0}.na.categorical_noloss'.format(loss), 'fraction')]
+        fields += [('{0}.na.categorical_{1}'.format(loss, y), 'loss')
+                   for y in range(2001, 2015)]
+    return fields
+
+
+def random_coords(rng, n):
+    '''random longitude/latitude (roughly covering inhabited latitudes)
+    '''
+    return rng.uniform(-180, 180, n), rng.uniform(-55, 70, n)
+
+
+def random_values(rng, kind, n):
+    '''random extract values of given kind
+    '''
+    if kind == 'ndvi':
+        values = rng.normal(4000, 1500, n)
+        values[rng.rand(n) < 0.01] = np.nan
+        return values
+    if kind == 'loss':
+        values = rng.rand(n) * 0.05
+        values[rng.rand(n) < 0.7] = 0
+        return values
+    if kind == 'count':
+        return rng.randint(1, 400, n).astype('float64')
+    scales = {'distance': 50000, 'elevation': 3000, 'slope': 50,
+              'density': 500, 'precip': 300, 'air_temp': 30,
+              'lights': 20, 'percent': 100, 'fraction': 1}
+    return rng.rand(n) * scales[kind]
+
+
+def extract_df(rng, n, fields):
+    '''frame of n rows of random extract values
+    '''
+    return pd.DataFrame(
+        dict((f, random_values(rng, kind, n)) for f, kind in fields),
+        columns=[f for f, _ in fields])
+
+
+def random_dates(rng, n, missing=0.3):
+    '''dd-mmm-yy date strings between 1992 and 2016 (some missing)
+    '''
+    day = rng.randint(1, 29, n)
+    month = rng.randint(0, 12, n)
+    year = rng.randint(1992, 2017, n) % 100
+    dates = pd.Series(['{0:02d}-{1}-{2:02d}'.format(d, month_names[m], y)
+                       for d, m, y in zip(day, month, year)], dtype='object')
+    dates[rng.rand(n) < missing] = None
+    return dates.values
+
+
+def random_ids(rng, ids, frac):
+    '''random subset of ids
+    '''
+    return ids[rng.rand(len(ids)) < frac]
+
+
+def padded_columns(columns):
+    '''frame from dict of unequal length lists (nan padded)
+    '''
+    size = max(len(v) for v in columns.values())
+    return pd.DataFrame(dict(
+        (k, list(v) + [np.nan] * (size - len(v))) for k, v in columns.items()),
+        columns=sorted(columns.keys()))
+
+
+def generate_projects(rng, counts):
+    '''gef project ids with their round
+    '''
+    n = counts['projects']
+    gef_id = rng.choice(np.arange(1, 20 * n), n, replace=False)
+    return pd.DataFrame({
+        'gef_id': gef_id,
+        'round': rng.choice(rounds, n),
+        'project_id': ['GEF_{0}'.format(i) for i in gef_id]
+    }, columns=['gef_id', 'round', 'project_id'])
+
+
+def generate_locations(rng, projects_df):
+    '''project locations (one row per treatment extract location)
+    '''
+    per_project = rng.randint(1, max_project_locations + 1, len(projects_df))
+    ix = np.repeat(np.arange(len(projects_df)), per_project)
+    n = len(ix)
+    locations_df = pd.DataFrame({
+        'id': np.arange(n),
+        'gef_id': projects_df['gef_id'].values[ix],
+        'project_id': projects_df['project_id'].values[ix],
+        'project_location_id': ['{0}_{1}'.format(g, i) for g, i in
+                                zip(projects_df['gef_id'].values[ix], range(n))],
+        'location_type_code': rng.choice(location_type_codes, n,
+                                         p=[0.3, 0.3, 0.2, 0.15, 0.03, 0.02])
+    })
+    locations_df['longitude'], locations_df['latitude'] = random_coords(rng, n)
+    return locations_df
+
+
+def write_csv(df, out_dir, rel_path):
+    '''write frame to rel_path under out_dir, returns row count
+    '''
+    path = os.path.join(out_dir, rel_path)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    df.to_csv(path, index=False, encoding='utf-8')
+    return len(df)
+
+
+def write_extracts(rng, out_dir, locations_df, counts):
+    '''treatment/control extracts and treatment location id lookup
+    '''
+    fields = extract_fields()
+
+    treatments_df = extract_df(rng, len(locations_df), fields)
+    for c in ['latitude', 'longitude', 'id', 'gef_id']:
+        treatments_df.insert(0, c, locations_df[c].values)
+
+    controls_df = extract_df(rng, counts['controls'], fields)
+    lon, lat = random_coords(rng, counts['controls'])
+    controls_df.insert(0, 'latitude', lat)
+    controls_df.insert(0, 'longitude', lon)
+    controls_df.insert(0, 'id', np.arange(counts['controls']))
+
+    rows = {}
+    rows['treatments'] = write_csv(
+        treatments_df, out_dir, 'raw_data/merge_gef_treatments.csv')
+    rows['controls'] = write_csv(
+        controls_df, out_dir, 'raw_data/merge_gef_controls.csv')
+    rows['treatments_location_id'] = write_csv(
+        locations_df[['id', 'project_location_id']],
+        out_dir, 'raw_data/treatments_location_id.csv')
+    return rows
+
+
+def write_aiddata(rng, out_dir, projects_df, locations_df):
+    '''aiddata projects, locations and projects_ancillary tables
+    '''
+    n = len(projects_df)
+    start = rng.randint(1995, 2016, n).astype('float64')
+    start[rng.rand(n) < 0.3] = np.nan
+    commitments = rng.rand(n) * 1e7
+
+    rows = {}
+    rows['projects_ancillary'] = write_csv(
+        projects_df[['gef_id', 'round']],
+        out_dir, aiddata_dir + '/projects_ancillary.csv')
+    rows['locations'] = write_csv(
+        locations_df[['project_location_id', 'project_id',
+                      'location_type_code', 'longitude', 'latitude']],
+        out_dir, aiddata_dir + '/locations.csv')
+    rows['projects'] = write_csv(pd.DataFrame({
+        'project_id': projects_df['project_id'].values,
+        'transactions_start_year': start,
+        'transactions_end_year': start + rng.randint(1, 8, n),
+        'total_commitments': commitments,
+        'total_disbursements': commitments * rng.rand(n)
+    }, columns=['project_id', 'transactions_start_year',
+                'transactions_end_year', 'total_commitments',
+                'total_disbursements']),
+        out_dir, aiddata_dir + '/projects.csv')
+    return rows
+
+
+def write_ancillary(rng, out_dir, projects_df):
+    '''gef project records, mfa funding and project category sheets
+    '''
+    gef_id = projects_df['gef_id'].values
+    n = len(gef_id)
+    is_mfa = (projects_df['round'] == 'MFA').values
+
+    secondary = pd.Series(rng.choice(['UNDP', 'UNEP', 'FAO'], n), dtype='object')
+    secondary[rng.rand(n) < 0.7] = None
+    country = rng.choice(['Brazil', 'Kenya', 'Peru', 'India', 'Regional',
+                          'Global'], n, p=[0.25, 0.2, 0.2, 0.2, 0.1, 0.05])
+
+    master_df = pd.DataFrame({
+        'GEF_ID': gef_id,
+        'Secondary agency(ies)': secondary.values,
+        'Country': country,
+        'Focal Area': np.where(is_mfa, 'Multi Focal Area',
+                               rng.choice(['Biodiversity', 'Land Degradation',
+                                           'Climate Change'], n)),
+        'Title': ['Project {0}'.format(i) for i in gef_id],
+        'GEF replenishment phase': rng.choice(gef_phases, n),
+        'Type acronym': rng.choice(['FP', 'MSP', 'EA'], n)
+    }, columns=['GEF_ID', 'Secondary agency(ies)', 'Country', 'Focal Area',
+                'Title', 'GEF replenishment phase', 'Type acronym'])
+    for field in date_fields:
+        master_df[field] = random_dates(rng, n)
+
+    funding_ids = gef_id[is_mfa | (rng.rand(n) < 0.1)]
+    m = len(funding_ids)
+    funding_df = pd.DataFrame({'GEF ID': funding_ids,
+                               'GEF phase': rng.choice(gef_phases[:-1], m),
+                               "List of project's focal areas": 'M'},
+                              columns=['GEF ID', 'GEF phase',
+                                       "List of project's focal areas"])
+    for c in funding_categories:
+        values = rng.rand(m) * 5e6
+        values[rng.rand(m) < 0.6] = np.nan
+        funding_df[c] = values
+    funding_df['Total GEF grant at CEO endorsement'] = (
+        funding_df[funding_categories].sum(axis=1))
+
+    # cd/mfa sheets have a single named focal area column followed by
+    # unnamed columns holding one focal area code each
+    sheet_columns = (["GEF ID", "List of project's focal areas",
+                      "Focal area(s) the roject intends to provide benefits to"]
+                     + [''] * 5)
+
+    def focal_area_sheet(ids):
+        codes = rng.choice(focal_area_codes, (len(ids), 7))
+        codes = np.where(rng.rand(len(ids), 7) < 0.5, '', codes)
+        values = np.column_stack([ids.astype('str'), codes])
+        return pd.DataFrame(values, columns=sheet_columns)
+
+    rows = {}
+    rows['master_gef_projects'] = write_csv(
+        master_df, out_dir, 'raw_data/ancillary/master_gef_projects.csv')
+    rows['gef_projects_160726'] = write_csv(
+        master_df, out_dir, 'raw_data/ancillary/gef_projects_160726.csv')
+    rows['mfa_funding_breakdown'] = write_csv(
+        funding_df, out_dir, 'raw_data/ancillary/mfa_funding_breakdown.csv')
+    rows['cd_projects_sheet'] = write_csv(
+        focal_area_sheet(random_ids(rng, gef_id, 0.3)),
+        out_dir, 'raw_data/ancillary/CD_MFA_CD_projects_sheet.csv')
+    rows['mfa_projects_sheet'] = write_csv(
+        focal_area_sheet(gef_id[is_mfa]),
+        out_dir, 'raw_data/ancillary/CD_MFA_MFA_projects_sheet.csv')
+
+    aiddata_ids = gef_id[is_mfa]
+    rows['aiddata_ancillary'] = write_csv(pd.DataFrame({
+        '906_ID': np.arange(len(aiddata_ids)),
+        'GEF_ID': aiddata_ids,
+        'Title': ['Project {0}'.format(i) for i in aiddata_ids],
+        'Focus Area': 'Multi Focal Area',
+        'Sub-Foci': [', '.join(rng.choice(sub_foci, rng.randint(1, 4),
+                                          replace=False))
+                     for _ in aiddata_ids]
+    }, columns=['906_ID', 'GEF_ID', 'Title', 'Focus Area', 'Sub-Foci']),
+        out_dir, 'raw_data/ancillary/GEF_MFA_AidData_Ancillary.csv')
+
+    prog_ids = gef_id[(projects_df['round'] == 'Programmatic').values]
+    rows['programmatic_list'] = write_csv(pd.DataFrame({
+        'Program GEF_ID': rng.choice(prog_ids, len(prog_ids)),
+        'Project GEF_ID': prog_ids
+    }, columns=['Program GEF_ID', 'Project GEF_ID']),
+        out_dir, 'raw_data/ancillary/programmatic_list.csv')
+
+    rows['nocd_lists'] = write_csv(padded_columns({
+        'mfa': random_ids(rng, gef_id[is_mfa], 0.8),
+        'ld': random_ids(rng, gef_id[(projects_df['round'] == 'Land Degradation').values], 0.8),
+        'bio': random_ids(rng, gef_id[(projects_df['round'] == 'Biodiversity').values], 0.8)
+    }), out_dir, 'raw_data/ancillary/nocd_lists.csv')
+    return rows
+
+
+def write_iba(rng, out_dir, counts):
+    '''iba monitoring records, 1-3 monitoring years per site
+    '''
+    n = counts['iba_sites']
+    per_site = rng.randint(1, 4, n)
+    ix = np.repeat(np.arange(n), per_site)
+    lon, lat = random_coords(rng, n)
+    iba_df = pd.DataFrame({
+        'SiteID': ix + 1,
+        'Longitude': lon[ix],
+        'Latitude': lat[ix],
+        'Area': (rng.rand(n) * 1e5)[ix],
+        'MonitoringYear': rng.randint(2000, 2016, len(ix)),
+        'StateScore': rng.choice([0, 1, 2, 3, 5], len(ix))
+    }, columns=['SiteID', 'Longitude', 'Latitude', 'Area',
+                'MonitoringYear', 'StateScore'])
+    return {'iba': write_csv(iba_df, out_dir,
+                             'raw_data/iba/IBA monitoring data 4 Nov 2015.csv')}
+
+
+def write_wdpa(rng, out_dir, projects_df, counts):
+    '''wdpa polygon shapefile and gef/wdpa id sheets
+    '''
+    import fiona
+    from shapely.geometry import Polygon, mapping
+
+    n = counts['wdpa_polygons']
+    wdpa_ids = rng.choice(np.arange(1, 50 * n), n, replace=False)
+    lon, lat = random_coords(rng, n)
+    radius = rng.rand(n) * 0.5 + 0.01
+    angles = np.linspace(0, 2 * np.pi, 7)[:-1]
+
+    shp_dir = os.path.join(out_dir, 'raw_data/wdpa/shps')
+    if not os.path.isdir(shp_dir):
+        os.makedirs(shp_dir)
+    schema = {'geometry': 'Polygon',
+              'properties': {'WDPA_PID': 'str', 'NAME': 'str'}}
+    shp_path = os.path.join(shp_dir, 'WDPA_Dec2016_poly_simp.shp')
+    with fiona.open(shp_path, 'w', driver='ESRI Shapefile', schema=schema,
+                    crs='EPSG:4326') as shp:
+        for i in range(n):
+            ring = zip(lon[i] + radius[i] * np.cos(angles),
+                       lat[i] + radius[i] * np.sin(angles))
+            shp.write({'geometry': mapping(Polygon(list(ring))),
+                       'properties': {'WDPA_PID': str(wdpa_ids[i]),
+                                      'NAME': 'PA {0}'.format(wdpa_ids[i])}})
+
+    # some ids do not exist in shapefile
+    id_pool = np.concatenate([wdpa_ids, rng.randint(50 * n, 60 * n, n // 10)])
+    gef_id = projects_df['gef_id'].values
+
+    def id_cells(m, frac):
+        cells = pd.Series(rng.choice(id_pool, m).astype('float64'))
+        cells[rng.rand(m) > frac] = np.nan
+        return cells.values
+
+    m = counts['wdpa_2014']
+    wdpa_2014_df = pd.DataFrame({
+        'PMIS GEF ID': rng.choice(gef_id, m),
+        'WDPA ID1': id_cells(m, 0.9),
+        'WDPA ID2': id_cells(m, 0.4),
+        'WDPA ID3': id_cells(m, 0.2),
+        'WDPA ID4': id_cells(m, 0.1),
+        'Found on PP?': rng.choice(['Y', 'N'], m, p=[0.8, 0.2])
+    }, columns=['PMIS GEF ID', 'WDPA ID1', 'WDPA ID2', 'WDPA ID3',
+                'WDPA ID4', 'Found on PP?'])
+
+    m = counts['wdpa_2015']
+    other_ids = pd.Series(['; '.join(str(i) for i in
+                                     rng.choice(id_pool, rng.randint(1, 4)))
+                           for _ in range(m)], dtype='object')
+    other_ids[rng.rand(m) < 0.7] = None
+    wdpa_2015_df = pd.DataFrame({
+        'gef_id': rng.choice(gef_id, m),
+        'WDPA ID': id_cells(m, 0.7),
+        'Other WDPA IDs': other_ids.values
+    }, columns=['gef_id', 'WDPA ID', 'Other WDPA IDs'])
+
+    rows = {'wdpa_polygons': n}
+    rows['wdpa_2014'] = write_csv(
+        wdpa_2014_df, out_dir,
+        'raw_data/wdpa/IUCN GEF Project and PA Database 24Oct (2014).csv')
+    rows['wdpa_2015'] = write_csv(
+        wdpa_2015_df, out_dir,
+        'raw_data/wdpa/PAsList (from Najeeb - 28 JUL 2015).csv')
+    return rows
+
+
+def generate_dataset(out_dir, scale=1, seed=0):
+    '''write synthetic raw_data tree under out_dir
+
+    returns dict of input name to row count
+    '''
+    rng = np.random.RandomState(seed)
+    counts = dict((k, int(v * scale)) for k, v in base_counts.items())
+
+    projects_df = generate_projects(rng, counts)
+    locations_df = generate_locations(rng, projects_df)
+
+    rows = {}
+    rows.update(write_extracts(rng, out_dir, locations_df, counts))
+    rows.update(write_aiddata(rng, out_dir, projects_df, locations_df))
+    rows.update(write_ancillary(rng, out_dir, projects_df))
+    rows.update(write_iba(rng, out_dir, counts))
+    rows.update(write_wdpa(rng, out_dir, projects_df, counts))
+
+    for d in ['data_prep/analysis_cases', 'results']:
+        path = os.path.join(out_dir, d)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    with open(os.path.join(out_dir, 'synthetic_data.json'), 'w') as f:
+        json.dump({'scale': scale, 'seed': seed, 'rows': rows},
+                  f, indent=4, sort_keys=True)
+
+    return rows
@@ -0,0 +1,273 @@
+"""
+wdpa polygon centroid table
+
+centroids (plus bbox and area) of the polygons in the wdpa shapefile are
+computed across a process pool, one chunk of features per task, and saved to
+a feather cache next to the shapefile. the cache is keyed by the size, mtime
+and sha1 hash of the shapefile components (and the selected wdpa ids / bbox)
+so that later runs can load it without touching the polygons.
+
+when only some protected areas are referenced, the shapefile is first
+scanned for their WDPA_PID with geometry decoding switched off (optionally
+limited to a bbox through the spatial filter), and only the geometries of
+matching features are then read and decoded.
+"""
+
+import os
+import json
+import hashlib
+from itertools import chain
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import pandas as pd
+import fiona
+from shapely.geometry import shape
+
+from load_data import file_stat, file_hash, read_meta, write_meta
+
+
+centroid_fields = ['wdpa_id', 'longitude', 'latitude',
+                   'minx', 'miny', 'maxx', 'maxy', 'area']
+
+# components of the shapefile which determine its content
+shp_components = ['.shp', '.shx', '.dbf']
+
+
+def shapefile_parts(shp_path):
+    '''existing component files of shapefile
+    '''
+    base = os.path.splitext(shp_path)[0]
+    return [base + ext for ext in shp_components
+            if os.path.isfile(base + ext)]
+
+
+def wdpa_feature_ids(shp_path, wdpa_ids, bbox=None, id_field='WDPA_PID'):
+    '''sorted ids of features whose id field is in wdpa_ids
+
+    only the id field is read (no geometry is decoded). bbox
+    (minx, miny, maxx, maxy) limits features to those intersecting it
+    '''
+    wanted = set(str(i) for i in wdpa_ids)
+    with fiona.open(shp_path) as shp:
+        other_fields = [f for f in shp.schema['properties'] if f != id_field]
+    with fiona.open(shp_path, ignore_fields=other_fields,
+                    ignore_geometry=True) as shp:
+        fids = [fid for fid, feat in shp.items()
+                if str(feat['properties'][id_field]) in wanted]
+    if bbox is not None:
+        with fiona.open(shp_path) as shp:
+            in_bbox = set(shp.keys(bbox=tuple(bbox)))
+        fids = [fid for fid in fids if fid in in_bbox]
+    return sorted(fids)
+
+
+def iter_features(shp, fids):
+    '''features of open shapefile by feature id
+
+    consecutive ids are read as runs of sequential reads
+    '''
+    i = 0
+    while i < len(fids):
+        j = i + 1
+        while j < len(fids) and fids[j] == fids[j - 1] + 1:
+            j += 1
+        for _, feat in shp.items(fids[i], fids[j - 1] + 1):
+            yield feat
+        i = j
+
+
+def centroid_chunk(args):
+    '''centroid, bbox and area for features fids of shapefile
+
+    invalid geometries get nan values so the caller can report them
+    '''
+    shp_path, fids = args
+    out = dict((k, []) for k in centroid_fields)
+    with fiona.open(shp_path) as shp:
+        for feat in iter_features(shp, fids):
+            out['wdpa_id'].append(feat['properties']['WDPA_PID'])
+            try:
+                geom = shape(feat['geometry'])
+                centroid = geom.centroid
+                bounds = geom.bounds
+                vals = [centroid.x, centroid.y] + list(bounds) + [geom.area]
+            except:
+                vals = [np.nan] * 7
+            for k, v in zip(centroid_fields[1:], vals):
+                out[k].append(v)
+    return out
+
+
+def build_wdpa_centroids(shp_path, processes=None, chunk_size=10000,
+                         fids=None):
+    '''build centroid table for features in shapefile
+
+    fids limits the table to those feature ids (all features by default).
+    returns dataframe with wdpa_id, longitude, latitude, bbox
+    (minx, miny, maxx, maxy) and area (square degrees) fields
+    '''
+    if fids is None:
+        with fiona.open(shp_path) as shp:
+            fids = list(range(len(shp)))
+
+    tasks = [(shp_path, fids[i:i + chunk_size])
+             for i in range(0, len(fids), chunk_size)]
+
+    if processes is None:
+        processes = cpu_count()
+
+    if processes > 1 and len(tasks) > 1:
+        pool = Pool(min(processes, len(tasks)))
+        try:
+            results = pool.map(centroid_chunk, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [centroid_chunk(t) for t in tasks]
+
+    centroid_df = pd.DataFrame(
+        dict((k, list(chain.from_iterable(r[k] for r in results)))
+             for k in centroid_fields),
+        columns=centroid_fields)
+    centroid_df['wdpa_id'] = centroid_df['wdpa_id'].astype('str')
+    for k in centroid_fields[1:]:
+        centroid_df[k] = centroid_df[k].astype('float64')
+
+    return centroid_df
+
+
+def selection_key(wdpa_ids, bbox):
+    '''key of wdpa id / bbox selection (None for all features)
+    '''
+    if wdpa_ids is None and bbox is None:
+        return None
+    ids = None if wdpa_ids is None else sorted(set(str(i) for i in wdpa_ids))
+    sel = json.dumps([ids, None if bbox is None else list(bbox)])
+    return hashlib.sha1(sel.encode('utf-8')).hexdigest()
+
+
+def select_centroids(centroid_df, wdpa_ids=None, bbox=None):
+    '''rows of centroid table with wdpa id in wdpa_ids and bbox
+    intersecting bbox
+    '''
+    keep = np.ones(len(centroid_df), dtype='bool')
+    if wdpa_ids is not None:
+        keep &= centroid_df['wdpa_id'].isin(set(str(i) for i in wdpa_ids)).values
+    if bbox is not None:
+        minx, miny, maxx, maxy = bbox
+        keep &= ((centroid_df['maxx'] >= minx) & (centroid_df['minx'] <= maxx)
+                 & (centroid_df['maxy'] >= miny) & (centroid_df['miny'] <= maxy)).values
+    if keep.all():
+        return centroid_df
+    return centroid_df.loc[keep].reset_index(drop=True)
+
+
+def load_wdpa_centroids(shp_path, cache_path, wdpa_ids=None, bbox=None,
+                        processes=None, chunk_size=10000):
+    '''load centroid table from cache, rebuilding it when shapefile changed
+
+    wdpa_ids / bbox limit the table to the referenced protected areas
+    (only their geometries are decoded when the table is rebuilt). a cache
+    of all features or of the same selection is reused.
+
+    size/mtime of shapefile components are checked first, the (slower)
+    content hash is only computed when they differ from the cached key
+    '''
+    shp_parts = shapefile_parts(shp_path)
+    stat = file_stat(shp_parts)
+    meta = read_meta(cache_path)
+    selection = selection_key(wdpa_ids, bbox)
+
+    if meta is not None and meta.get('selection') not in [None, selection]:
+        meta = None
+
+    if meta is not None and meta['stat'] == stat:
+        return select_centroids(pd.read_feather(cache_path), wdpa_ids, bbox)
+
+    sha = file_hash(shp_parts)
+
+    if meta is not None and meta['hash'] == sha:
+        # content unchanged (e.g. file was touched/copied), refresh key only
+        centroid_df = pd.read_feather(cache_path)
+        selection = meta.get('selection')
+    else:
+        fids = None
+        if wdpa_ids is not None:
+            fids = wdpa_feature_ids(shp_path, wdpa_ids, bbox=bbox)
+        elif bbox is not None:
+            with fiona.open(shp_path) as shp:
+                fids = sorted(shp.keys(bbox=tuple(bbox)))
+        centroid_df = build_wdpa_centroids(shp_path, processes=processes,
+                                           chunk_size=chunk_size, fids=fids)
+        centroid_df.to_feather(cache_path)
+
+    write_meta(cache_path, {'stat': stat, 'hash': sha,
+                            'selection': selection,
+                            'feature_count': len(centroid_df)})
+
+    return select_centroids(centroid_df, wdpa_ids, bbox)
+
+
+def explode_wdpa_ids(gef_wdpa_df, id_fields):
+    '''long form of the wdpa ids held in id_fields
+
+    cells can hold a single (int, float or string) id or multiple ids
+    separated by any non word characters. returns dataframe with one row
+    per id: row (position in gef_wdpa_df), slot (position of field in
+    id_fields), pos (position within cell) and wdpa_id (as string)
+    '''
+    wide_df = gef_wdpa_df[id_fields].copy()
+    wide_df.index = np.arange(len(wide_df))
+    wide_df.columns = np.arange(len(id_fields))
+
+    cells = wide_df.stack().dropna()
+    cells = cells.loc[cells.astype('str').str.strip() != '']
+
+    # numeric cells (e.g. 1234.0) are single ids
+    numeric = pd.to_numeric(cells, errors='coerce')
+    is_numeric = numeric.notnull()
+    cells = cells.astype('object')
+    cells.loc[is_numeric] = numeric.loc[is_numeric].astype('int64').astype('str')
+
+    tokens = cells.astype('str').str.split(r'\W+', expand=True).stack()
+    tokens = tokens.loc[tokens.notnull() & tokens.str.match(r'^\d+$')]
+
+    long_df = pd.DataFrame({
+        'row': tokens.index.get_level_values(0),
+        'slot': tokens.index.get_level_values(1),
+        'pos': tokens.index.get_level_values(2),
+        'wdpa_id': tokens.astype('int64').astype('str').values
+    }, columns=['row', 'slot', 'pos', 'wdpa_id'])
+
+    return long_df
+
+
+def resolve_wdpa_coords(long_df, centroid_df, row_count, missing=-999):
+    '''coordinates of the first wdpa id (by slot, then position within
+    cell) of each row which exists in the centroid table
+
+    long_df is output of explode_wdpa_ids. returns dataframe with
+    row_count rows and longitude, latitude and wdpa_id (matched id)
+    fields. rows without any match get `missing` coordinates
+    '''
+    lookup_df = centroid_df[['wdpa_id', 'longitude', 'latitude']]
+    lookup_df = lookup_df.drop_duplicates(subset='wdpa_id')
+
+    match_df = long_df.merge(lookup_df, on='wdpa_id', how='inner')
+    match_df = match_df.sort_values(by=['row', 'slot', 'pos'])
+    match_df = match_df.drop_duplicates(subset='row')
+
+    out = pd.DataFrame({
+        'longitude': np.full(row_count, missing, dtype='float64'),
+        'latitude': np.full(row_count, missing, dtype='float64'),
+        'wdpa_id': np.full(row_count, None, dtype='object')
+    }, columns=['longitude', 'latitude', 'wdpa_id'])
+
+    rows = match_df['row'].values
+    out.loc[rows, 'longitude'] = match_df['longitude'].values
+    out.loc[rows, 'latitude'] = match_df['latitude'].values
+    out.loc[rows, 'wdpa_id'] = match_df['wdpa_id'].values
+
+    return out
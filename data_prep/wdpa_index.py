@@ -0,0 +1,229 @@
+"""
+point in protected area join over wdpa polygons
+
+wdpa polygons are kept in a polygon store (wkb + bbox per polygon) cached
+next to the shapefile, keyed the same way as the centroid table (see
+wdpa_centroids.py). a packed r-tree (shapely STRtree) is built over the
+polygons and every point lookup is done in two passes:
+
+    candidates  polygons whose bbox intersects the point (or the point's
+                search window for distance lookups) are found through
+                the tree
+    exact       containment / distance is only evaluated on candidates
+
+distances are great circle distances (km) from the point to the closest
+point of the polygon (closest in lon/lat), so they are exact for points
+inside polygons and a close upper bound otherwise.
+"""
+
+import numpy as np
+import pandas as pd
+import fiona
+import shapely
+from shapely import wkb
+from shapely.geometry import shape, box
+from shapely.ops import nearest_points
+from shapely.strtree import STRtree
+
+from load_data import file_stat, file_hash, read_meta, write_meta
+from wdpa_centroids import shapefile_parts, iter_features
+from iba_index import earth_radius, valid_coords
+from lazy_geometry import point_geoms
+
+
+# shapely >= 2.0 queries arrays of geometries at once
+vectorized = hasattr(shapely, 'points')
+
+polygon_fields = ['wdpa_id', 'minx', 'miny', 'maxx', 'maxy', 'area', 'wkb']
+
+# km per degree of latitude
+km_per_degree = np.pi * earth_radius / 180.0
+
+
+def build_wdpa_polygons(shp_path, fids=None):
+    '''polygon store of shapefile features (all features by default)
+
+    invalid geometries are repaired with a zero buffer, features which
+    can not be repaired are dropped
+    '''
+    out = dict((k, []) for k in polygon_fields)
+    with fiona.open(shp_path) as shp:
+        if fids is None:
+            fids = list(range(len(shp)))
+        for feat in iter_features(shp, fids):
+            try:
+                geom = shape(feat['geometry'])
+                if not geom.is_valid:
+                    geom = geom.buffer(0)
+            except Exception:
+                continue
+            if geom.is_empty:
+                continue
+            out['wdpa_id'].append(str(feat['properties']['WDPA_PID']))
+            for k, v in zip(['minx', 'miny', 'maxx', 'maxy'], geom.bounds):
+                out[k].append(v)
+            out['area'].append(geom.area)
+            out['wkb'].append(geom.wkb)
+    return pd.DataFrame(out, columns=polygon_fields)
+
+
+def load_wdpa_polygons(shp_path, cache_path):
+    '''load polygon store from cache, rebuilding it when shapefile changed
+    '''
+    shp_parts = shapefile_parts(shp_path)
+    stat = file_stat(shp_parts)
+    meta = read_meta(cache_path)
+
+    if meta is not None and meta['stat'] == stat:
+        return pd.read_feather(cache_path)
+
+    sha = file_hash(shp_parts)
+
+    if meta is not None and meta['hash'] == sha:
+        polygon_df = pd.read_feather(cache_path)
+    else:
+        polygon_df = build_wdpa_polygons(shp_path)
+        polygon_df.to_feather(cache_path)
+
+    write_meta(cache_path, {'stat': stat, 'hash': sha,
+                            'feature_count': len(polygon_df)})
+
+    return polygon_df
+
+
+def build_wdpa_tree(polygon_df):
+    '''STRtree over polygon store, returns (tree, array of polygons)
+    '''
+    geoms = np.empty(len(polygon_df), dtype='object')
+    geoms[:] = [wkb.loads(bytes(b)) for b in polygon_df['wkb']]
+    return STRtree(list(geoms)), geoms
+
+
+def query_pairs(tree, geoms, windows, predicate=None):
+    '''(window index, polygon index) pairs of polygons found for each
+    query geometry (bbox intersection, then predicate if given)
+    '''
+    if vectorized:
+        pairs = tree.query(np.asarray(windows), predicate=predicate)
+        return pairs[0].astype('int64'), pairs[1].astype('int64')
+
+    # shapely 1.x: tree returns geometries, one query per window
+    poly_ix = dict((id(g), i) for i, g in enumerate(geoms))
+    rows, polys = [], []
+    for i, window in enumerate(windows):
+        for g in tree.query(window):
+            if predicate is None or getattr(window, predicate)(g):
+                rows.append(i)
+                polys.append(poly_ix[id(g)])
+    return np.array(rows, dtype='int64'), np.array(polys, dtype='int64')
+
+
+def search_windows(lon, lat, km):
+    '''lon/lat boxes around points covering at least km in every direction
+    '''
+    dlat = km / km_per_degree
+    coslat = np.cos(np.radians(np.clip(np.abs(lat) + dlat, 0, 89.0)))
+    dlon = np.minimum(km / (km_per_degree * coslat), 180.0)
+    if vectorized:
+        return shapely.box(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+    out = np.empty(len(lon), dtype='object')
+    out[:] = [box(*b) for b in zip(lon - dlon, lat - dlat, lon + dlon, lat + dlat)]
+    return out
+
+
+def haversine_km(lon1, lat1, lon2, lat2):
+    '''great circle distance (km) between lon/lat arrays
+    '''
+    lon1, lat1, lon2, lat2 = [np.radians(np.asarray(a, dtype='float64'))
+                              for a in (lon1, lat1, lon2, lat2)]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * earth_radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def closest_coords(polys, pts):
+    '''lon/lat of the closest point of each polygon to each point
+    '''
+    if vectorized:
+        line_coords = shapely.get_coordinates(shapely.shortest_line(polys, pts))
+        return line_coords[0::2, 0], line_coords[0::2, 1]
+    near = [nearest_points(p, q)[0] for p, q in zip(polys, pts)]
+    return (np.array([n.x for n in near], dtype='float64'),
+            np.array([n.y for n in near], dtype='float64'))
+
+
+def group_starts(rows):
+    '''mask of first entry of each run of equal (sorted) row indices
+    '''
+    starts = np.ones(len(rows), dtype='bool')
+    starts[1:] = rows[1:] != rows[:-1]
+    return starts
+
+
+def wdpa_join(tree, geoms, polygon_df, lon, lat, radii):
+    '''protected area containment and proximity of each lon/lat pair
+
+    returns dataframe (one row per input point, in input order) with
+    wdpa_in (1 if inside any polygon), wdpa_in_count, wdpa_in_id
+    (smallest containing polygon), wdpa_distance (km to closest polygon
+    within the largest radius, nan beyond), wdpa_nearest_id and
+    wdpa_within_{r}km flags for each radius
+    '''
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.asarray(lat, dtype='float64')
+    n = len(lon)
+    radii = sorted(radii)
+    wdpa_ids = polygon_df['wdpa_id'].values.astype('object')
+    areas = polygon_df['area'].values
+
+    valid_ix = np.where(valid_coords(lon, lat))[0]
+    pts = point_geoms(lon[valid_ix], lat[valid_ix])
+
+    out = pd.DataFrame(index=range(n))
+
+    # containment (exact test on bbox candidates)
+    rows, polys = query_pairs(tree, geoms, pts, predicate='intersects')
+    rows = valid_ix[rows]
+    # smallest containing polygon first
+    order = np.lexsort((areas[polys], rows))
+    rows, polys = rows[order], polys[order]
+    first = group_starts(rows)
+
+    out['wdpa_in_count'] = np.bincount(rows, minlength=n)
+    out['wdpa_in'] = (out['wdpa_in_count'] > 0).astype('int')
+    in_id = np.full(n, None, dtype='object')
+    in_id[rows[first]] = wdpa_ids[polys[first]]
+    out['wdpa_in_id'] = in_id
+
+    # distance to polygons within largest radius
+    distance = np.full(n, np.nan, dtype='float64')
+    nearest_id = np.full(n, None, dtype='object')
+    if len(valid_ix) and radii:
+        windows = search_windows(lon[valid_ix], lat[valid_ix], max(radii))
+        w_rows, w_polys = query_pairs(tree, geoms, windows)
+        if len(w_rows):
+            px, py = closest_coords(geoms[w_polys], pts[w_rows])
+            w_rows = valid_ix[w_rows]
+            dist = haversine_km(lon[w_rows], lat[w_rows], px, py)
+            order = np.lexsort((dist, w_rows))
+            w_rows, w_polys, dist = w_rows[order], w_polys[order], dist[order]
+            first = group_starts(w_rows)
+            distance[w_rows[first]] = dist[first]
+            nearest_id[w_rows[first]] = wdpa_ids[w_polys[first]]
+    # points inside a polygon are at distance 0
+    inside = out['wdpa_in'].values == 1
+    distance[inside] = 0
+    nearest_id[inside] = in_id[inside]
+
+    with np.errstate(invalid='ignore'):
+        beyond = ~(distance <= max(radii or [0]))
+    distance[beyond] = np.nan
+    nearest_id[beyond] = None
+    out['wdpa_distance'] = distance
+    out['wdpa_nearest_id'] = nearest_id
+    for r in radii:
+        with np.errstate(invalid='ignore'):
+            out['wdpa_within_{0}km'.format(r)] = (distance <= r).astype('int')
+
+    return out[['wdpa_in', 'wdpa_in_count', 'wdpa_in_id', 'wdpa_distance',
+                'wdpa_nearest_id'] + ['wdpa_within_{0}km'.format(r) for r in radii]]
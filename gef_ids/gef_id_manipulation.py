@@ -1,52 +1,54 @@
 
 
 
+import sys
 import os
-import pandas as pd
 
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), '..', 'data_prep'))
 
-def read_csv(path):
-    '''read csv using pandas
-    '''
-    path = os.path.expanduser(path)
-    return pd.read_csv(path, quotechar='\"',
-                       na_values='', keep_default_na=False,
-                       encoding='utf-8')
+from load_data import read_csv
+from gef_id_registry import (parse_ids, id_set, union, intersection,
+                             difference, in_set, group_counts, failure_report,
+                             invalid_key)
 
 
-def clean_id(z):
-    try:
-        return str(int(z))
-    except:
-        return str(z)
-
 # -------------------------------------
 # complete level 1
 projects = read_csv('~/git/GEF_Programmatic/gef_ids/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data/projects.csv')
 locations = read_csv('~/git/GEF_Programmatic/gef_ids/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data/locations.csv')
 ancillary = read_csv('~/git/GEF_Programmatic/gef_ids/GlobalEnvironmentFacility_GeocodedResearchRelease_Level1_v1.0/data/projects_ancillary.csv')
-ancillary['gef_id'] = ancillary['gef_id'].apply(lambda z: clean_id(z))
 
-all_ids = list(set(ancillary['gef_id']))
-prog_ids = list(set(ancillary.loc[ancillary['round'].isin(['Programmatic'])]['gef_id']))
+# parsed keys of the ancillary gef ids (source gef_id field is written
+# out unchanged)
+ancillary_keys = parse_ids(ancillary['gef_id'], source='projects_ancillary gef_id')
+ancillary_unparsed = ancillary_keys == invalid_key
+ancillary_prog = ancillary['round'].isin(['Programmatic']).values
+
+# id lists are sorted unique int64 key arrays (see gef_id_registry.py)
+all_ids = id_set(ancillary_keys)
+prog_ids = id_set(ancillary_keys[ancillary_prog])
+
+# programmatic ids which do not parse are still kept (matched on their
+# source value)
+prog_unparsed_ids = ancillary['gef_id'][ancillary_unparsed & ancillary_prog].unique()
 
 
 # -------------------------------------
 # # extracts
 # active = read_csv('~/git/GEF_Programmatic/gef_ids/merged_data.csv')
 # active = active.loc[~active['type'].isin(['rand'])]
-# active['gef_id'] = active['gef_id'].apply(lambda z: clean_id(z))
+# active['gef_id'] = parse_ids(active['gef_id'])
 
-# prog = list(set(active.loc[active['type'].isin(['prog'])]['gef_id']))
-# mfa = list(set(active.loc[active['type'].isin(['mfa'])]['gef_id']))
-# land = list(set(active.loc[active['type'].isin(['land'])]['gef_id']))
-# bio = list(set(active.loc[active['type'].isin(['bio', 'ext_bio'])]['gef_id']))
+# prog = id_set(active.loc[active['type'].isin(['prog'])]['gef_id'])
+# mfa = id_set(active.loc[active['type'].isin(['mfa'])]['gef_id'])
+# land = id_set(active.loc[active['type'].isin(['land'])]['gef_id'])
+# bio = id_set(active.loc[active['type'].isin(['bio', 'ext_bio'])]['gef_id'])
 
 
 # # LD level 1
 # LD = read_csv('~/git/GEF_Programmatic/gef_ids/LD_projects_ancillary.csv')
-# LD['gef_id'] = LD['gef_id'].apply(lambda z: clean_id(z))
-# land_alt = list(set(LD['gef_id']))
+# land_alt = id_set(LD['gef_id'])
 
 
 # -------------------------------------
@@ -55,38 +57,44 @@ prog_ids = list(set(ancillary.loc[ancillary['round'].isin(['Programmatic'])]['ge
 # this is csv combining MFA+LD SFA sheet and BD SFA sheet
 gef_valid = read_csv('~/git/GEF_Programmatic/gef_ids/valid_mfa_and_sfa.csv')
 
-mfa_valid = list(set(gef_valid['mfa'][gef_valid['mfa'].notnull()].astype('int').astype('str')))
-ld_valid = list(set(gef_valid['ld'][gef_valid['ld'].notnull()].astype('int').astype('str')))
-# combo_valid = list(set(gef_valid['combo'][gef_valid['combo'].notnull()].astype('int').astype('str')))
-bio_valid = list(set(gef_valid['bio'][gef_valid['bio'].notnull()].astype('int').astype('str')))
+mfa_valid = id_set(gef_valid['mfa'], source='valid mfa')
+ld_valid = id_set(gef_valid['ld'], source='valid ld')
+# combo_valid = id_set(gef_valid['combo'], source='valid combo')
+bio_valid = id_set(gef_valid['bio'], source='valid bio')
 
-total_valid = mfa_valid + ld_valid + bio_valid
+total_valid = union(mfa_valid, ld_valid, bio_valid)
 
 # initial full missing sheet
 not_geocoded_plus_missing = read_csv('~/git/GEF_Programmatic/gef_ids/not_geocoded_plus_missing.csv')
-not_geocoded_plus_missing['gef_id'] = not_geocoded_plus_missing['GEF ID'].apply(lambda z: clean_id(z))
-not_geocoded_plus_missing_list =  list(set(not_geocoded_plus_missing['gef_id']))
+not_geocoded_plus_missing_list = id_set(not_geocoded_plus_missing['GEF ID'], source='not_geocoded_plus_missing')
 
 # missing sheet after projects that were not geocoded were removed
 missing = read_csv('~/git/GEF_Programmatic/gef_ids/missing.csv')
-missing['gef_id'] = missing['GEF ID'].apply(lambda z: clean_id(z))
-missing_list =  list(set(missing['gef_id']))
+missing_list = id_set(missing['GEF ID'], source='missing')
 
-not_geocoded_list = [i for i in not_geocoded_plus_missing_list if i not in missing_list]
+not_geocoded_list = difference(not_geocoded_plus_missing_list, missing_list)
 
 
 # -------------------------------------
 # checks
 
-keep = list(set(total_valid) - set(not_geocoded_list)) + prog_ids
+keep = union(difference(total_valid, not_geocoded_list), prog_ids)
 
 # cur = prog + mfa + bio + land + land_alt
 cur = all_ids
 
-out = [i for i in list(cur) if i in keep]
+out = intersection(cur, keep)
+
 
+ancillary['is_valid'] = (in_set(ancillary_keys, out)
+                         | (ancillary_unparsed
+                            & ancillary['gef_id'].isin(prog_unparsed_ids).values)
+                         ).astype(int)
 
-ancillary['is_valid'] = ancillary['gef_id'].isin(out).astype(int)
+parse_failures_df = failure_report()
+if len(parse_failures_df):
+    print "Unparsed gef ids:"
+    print parse_failures_df.groupby('source').size().to_dict()
 
 ancillary.to_csv(
     '~/git/GEF_Programmatic/gef_ids/checked_projects_ancillary.csv',
@@ -100,37 +108,23 @@ projects_merge.to_csv(
     index=False, encoding='utf-8')
 
 
-locations_merge = projects_merge.merge(locations, on="project_id")
-
-# -------------------------------------
-
-
-print "Programmatic Projects: {0}".format(
-    len(projects_merge.loc[projects_merge['round'] == 'Programmatic']))
-
-print "MFA Projects: {0}".format(
-    len(projects_merge.loc[projects_merge['round'] == 'MFA']))
-
-print "Biodiversity Projects: {0}".format(
-    len(projects_merge.loc[projects_merge['round'] == 'Biodiversity']))
-
-print "Land Degradation Projects: {0}".format(
-    len(projects_merge.loc[projects_merge['round'] == 'Land Degradation']))
+# locations of each valid project (rather than materializing the
+# project / location merge just to count rows)
+location_counts = projects_merge['project_id'].map(
+    locations['project_id'].value_counts()).fillna(0).values
 
+project_round_counts = group_counts(projects_merge['round'])
+location_round_counts = group_counts(projects_merge['round'],
+                                     weights=location_counts)
 
+# -------------------------------------
 
 
-print "Programmatic Locations: {0}".format(
-    len(locations_merge.loc[locations_merge['round'] == 'Programmatic']))
-
-print "MFA Locations: {0}".format(
-    len(locations_merge.loc[locations_merge['round'] == 'MFA']))
-
-print "Biodiversity Locations: {0}".format(
-    len(locations_merge.loc[locations_merge['round'] == 'Biodiversity']))
+for r in ['Programmatic', 'MFA', 'Biodiversity', 'Land Degradation']:
+    print "{0} Projects: {1}".format(r, project_round_counts.get(r, 0))
 
-print "Land Degradation Locations: {0}".format(
-    len(locations_merge.loc[locations_merge['round'] == 'Land Degradation']))
+for r in ['Programmatic', 'MFA', 'Biodiversity', 'Land Degradation']:
+    print "{0} Locations: {1}".format(r, location_round_counts.get(r, 0))
 
 
 
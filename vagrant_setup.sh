@@ -64,6 +64,8 @@ sudo pip install Cython
 sudo pip install nose
 sudo pip install numpy
 sudo pip install pandas
+# last pyarrow release for python 2.7
+sudo pip install pyarrow==0.16.0
 sudo apt-get install -y python-scipy
 
 cd CausalForest/scikit-learn